@@ -1,106 +1,220 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import asyncio
+import json
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import math
 
+from app.core.config import settings
 from app.core.database import get_database
-from app.models.candidate import CandidateResponse, CandidateListResponse, CandidateUpdate
-from app.services.ai_service import ai_service
-from app.services.document_service import document_service
+from app.core.pagination import KEYSET_SORT, keyset_filter, split_page
+from app.core.projection import build_projection
+from app.models.candidate import CandidateResponse, CandidateListResponse, CandidateUpdate, CandidateSearchResponse, ReanalysisRunResponse, CANDIDATE_SUMMARY_FIELDS
+from app.services.ai_service import ai_service, GeminiUnavailableError
+from app.services.document_service import document_service, FileTooLargeError
+from app.services.reanalysis_service import reanalysis_service
+from app.services import prompt_builder
+from app.services.skill_service import skill_service
+from app.services.text_store import text_store
+from app.services.vector_index import vector_index
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Fields a client may select with `fields=`
+CANDIDATE_FIELDS = [name for name in CandidateResponse.model_fields if name != "id"]
 
-@router.post("/upload", response_model=dict)
-async def upload_candidates(files: List[UploadFile] = File(...)):
-    """Upload and analyze candidate CV files"""
-    db = await get_database()
-    results = []
-    
-    for file in files:
+
+async def _save_candidate_file(db, file: UploadFile, seen_hashes: set) -> tuple[Optional[dict], Optional[tuple]]:
+    """Validate, save and de-duplicate one upload, returning (result, saved file)"""
+    try:
+        # Validate file type
+        if not document_service.is_allowed_file(file.filename):
+            return {
+                "filename": file.filename,
+                "status": "error",
+                "message": "Invalid file type. Only PDF and DOCX are allowed."
+            }, None
+        
+        # Stream file to disk and get hash
         try:
-            # Validate file type
-            if not document_service.is_allowed_file(file.filename):
-                results.append({
-                    "filename": file.filename,
-                    "status": "error",
-                    "message": "Invalid file type. Only PDF and DOCX are allowed."
-                })
-                continue
-            
-            # Save file and get hash
-            filename, file_hash = await document_service.save_uploaded_file(file)
-            
-            # Check if file already exists
-            existing = await db.candidates.find_one({"filehash": file_hash})
-            if existing:
-                results.append({
-                    "filename": file.filename,
-                    "status": "skipped",
-                    "message": "File already exists"
-                })
-                continue
-            
-            # Extract text content
-            cv_content = document_service.extract_text_from_file(filename)
+            temp_path, file_hash = await document_service.save_uploaded_file(file)
+        except FileTooLargeError as e:
+            return {
+                "filename": file.filename,
+                "status": "error",
+                "message": str(e)
+            }, None
+        
+        # Check if file already exists, in this batch or the database, before keeping anything
+        if file_hash in seen_hashes:
+            existing = True
+        else:
+            seen_hashes.add(file_hash)
+            existing = await db.candidates.find_one({"filehash": file_hash}, {"_id": 1})
+        if existing:
+            document_service.discard_temp_file(temp_path)
+            return {
+                "filename": file.filename,
+                "status": "skipped",
+                "message": "File already exists"
+            }, None
+        
+        filename = document_service.commit_uploaded_file(temp_path, file.filename)
+        return None, (file.filename, filename, file_hash)
+        
+    except Exception as e:
+        logger.error(f"Error processing file {file.filename}: {str(e)}")
+        return {
+            "filename": file.filename,
+            "status": "error",
+            "message": str(e)
+        }, None
+
+
+async def _ingest_candidate_file(db, original_filename: str, filename: str, file_hash: str, semaphore: asyncio.Semaphore) -> dict:
+    """Extract, analyze and store one saved upload"""
+    async with semaphore:
+        try:
+            # Reuse text stored for the same file, e.g. from an earlier failed upload
+            cv_content = await text_store.get(db, file_hash)
+            if cv_content is None:
+                # Extract text content in the process pool
+                extracted = await document_service.extract_text(filename)
+                cv_content = extracted.text
+                if cv_content:
+                    await text_store.save(db, file_hash, cv_content, extracted.pages)
             if not cv_content:
-                results.append({
-                    "filename": file.filename,
+                return {
+                    "filename": original_filename,
                     "status": "error",
                     "message": "Could not extract text from file"
-                })
-                continue
+                }
             
-            # Analyze with AI
-            analysis_result = await ai_service.analyze_candidate(cv_content)
+            # Analyze with AI; a failed analysis is kept unstamped so a re-analysis run retries it
+            try:
+                analysis_result = await ai_service.analyze_candidate(cv_content, fallback=False)
+                analysis_info = ai_service.candidate_analysis_info()
+            except GeminiUnavailableError:
+                raise
+            except Exception:
+                analysis_result = ai_service._get_default_candidate_response()
+                analysis_info = {}
             
             # Prepare candidate data
             candidate_data = {
                 **analysis_result,
-                "cv_name": file.filename,
+                "skill_terms": skill_service.candidate_skill_terms(analysis_result),
+                "analysis_version": prompt_builder.analysis_version(analysis_result),
+                **analysis_info,
+                "cv_name": original_filename,
                 "filehash": file_hash,
                 "created_at": datetime.utcnow()
             }
             
-            # Save to database
-            result = await db.candidates.insert_one(candidate_data)
+            # Save to database; the unique filehash index catches concurrent duplicates
+            try:
+                result = await db.candidates.insert_one(candidate_data)
+            except DuplicateKeyError:
+                await document_service.delete_file(filename)
+                return {
+                    "filename": original_filename,
+                    "status": "skipped",
+                    "message": "File already exists"
+                }
             
-            results.append({
-                "filename": file.filename,
+            await vector_index.upsert(result.inserted_id, candidate_data)
+            
+            return {
+                "filename": original_filename,
                 "status": "success",
                 "candidate_id": str(result.inserted_id)
-            })
+            }
             
         except Exception as e:
-            logger.error(f"Error processing file {file.filename}: {str(e)}")
-            results.append({
-                "filename": file.filename,
+            logger.error(f"Error processing file {original_filename}: {str(e)}")
+            
+            # Nothing references the file yet, so a retried upload starts clean
+            await document_service.delete_file(filename)
+            return {
+                "filename": original_filename,
                 "status": "error",
                 "message": str(e)
-            })
+            }
+
+
+@router.post("/upload", response_model=dict)
+async def upload_candidates(
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(False, description="Stream per-file results as NDJSON as each file finishes")
+):
+    """Upload and analyze candidate CV files"""
+    db = await get_database()
+    
+    # Save every file up front; uploads are only readable while the request is open
+    seen_hashes = set()
+    saved_files = await asyncio.gather(
+        *(_save_candidate_file(db, file, seen_hashes) for file in files)
+    )
+    
+    # Extraction, analysis and insert run concurrently per file, bounded by UPLOAD_CONCURRENCY
+    semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+    results = [result for result, _ in saved_files]
+    tasks = {}
+    for index, (_, saved) in enumerate(saved_files):
+        if saved:
+            tasks[index] = asyncio.ensure_future(_ingest_candidate_file(db, *saved, semaphore))
+    
+    if stream:
+        async def result_stream():
+            for result in results:
+                if result is not None:
+                    yield json.dumps(result) + "\n"
+            for task in asyncio.as_completed(tasks.values()):
+                yield json.dumps(await task) + "\n"
+        
+        return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+    
+    for index, result in zip(tasks, await asyncio.gather(*tasks.values())):
+        results[index] = result
     
     return {"results": results}
 
 
-@router.get("/", response_model=CandidateListResponse)
+@router.get("/", response_model=CandidateListResponse, response_model_exclude_unset=True)
 async def list_candidates(
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100)
+    page_size: int = Query(10, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Token from next_after; takes precedence over page"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return instead of the summary")
 ):
     """Get paginated list of candidates"""
     db = await get_database()
     
-    # Count total documents
-    total_count = await db.candidates.count_documents({})
+    # Metadata count; exact counts scan the whole collection
+    total_count = await db.candidates.estimated_document_count()
     total_pages = math.ceil(total_count / page_size)
     
-    # Get paginated results
-    skip = (page - 1) * page_size
-    cursor = db.candidates.find().skip(skip).limit(page_size).sort("created_at", -1)
-    candidates = await cursor.to_list(length=page_size)
+    # Only fetch what the page shows; created_at is needed for the next token
+    try:
+        projection = build_projection(fields, CANDIDATE_FIELDS, CANDIDATE_SUMMARY_FIELDS, required=("created_at",))
+        query = keyset_filter(after) if after else {}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if after:
+        # Keyset pagination: constant cost however deep the page
+        cursor = db.candidates.find(query, projection).sort(KEYSET_SORT).limit(page_size + 1)
+    else:
+        # Page numbers are kept for compatibility; deep pages still skip
+        skip = (page - 1) * page_size
+        cursor = db.candidates.find(query, projection).sort(KEYSET_SORT).skip(skip).limit(page_size + 1)
+    
+    candidates, next_after = split_page(await cursor.to_list(length=page_size + 1), page_size)
     
     # Convert ObjectId to string
     for candidate in candidates:
@@ -109,10 +223,120 @@ async def list_candidates(
     return CandidateListResponse(
         results=candidates,
         total_page=total_pages,
+        total_file=total_count,
+        next_after=next_after
+    )
+
+
+@router.get("/search", response_model=CandidateSearchResponse)
+async def search_candidates(
+    skills: str = Query(..., description="Comma separated skills, e.g. python,k8s"),
+    mode: str = Query("all", pattern="^(all|any)$", description="Require all skills or any of them"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100)
+):
+    """Find candidates by normalized skills, ranked by how many they match"""
+    db = await get_database()
+    
+    terms = skill_service.parse_query(skills)
+    if not terms:
+        raise HTTPException(status_code=400, detail="No skills to search for")
+    
+    # Served by the multikey index on skill_terms
+    query = {"skill_terms": {"$all": terms} if mode == "all" else {"$in": terms}}
+    total_count = await db.candidates.count_documents(query)
+    total_pages = math.ceil(total_count / page_size)
+    
+    cursor = db.candidates.aggregate([
+        {"$match": query},
+        {"$addFields": {"matched_skills": {"$filter": {
+            "input": "$skill_terms",
+            "as": "skill",
+            "cond": {"$in": ["$$skill", terms]}
+        }}}},
+        {"$addFields": {"overlap": {"$size": "$matched_skills"}}},
+        {"$sort": {"overlap": -1, "_id": -1}},
+        {"$skip": (page - 1) * page_size},
+        {"$limit": page_size},
+        {"$project": {
+            "candidate_name": 1,
+            "email": 1,
+            "cv_name": 1,
+            "matched_skills": 1,
+            "overlap": 1
+        }}
+    ])
+    
+    results = []
+    async for candidate in cursor:
+        results.append({
+            "id": str(candidate["_id"]),
+            "candidate_name": candidate.get("candidate_name", "Unknown"),
+            "email": candidate.get("email", ""),
+            "cv_name": candidate.get("cv_name", ""),
+            "matched_skills": candidate["matched_skills"],
+            "overlap": candidate["overlap"]
+        })
+    
+    return CandidateSearchResponse(
+        results=results,
+        skills=terms,
+        total_page=total_pages,
         total_file=total_count
     )
 
 
+@router.post("/reanalyze")
+async def reanalyze_candidates():
+    """Start re-analyzing every candidate not analyzed with the current prompt and model"""
+    db = await get_database()
+    
+    try:
+        # Persist the run and hand it to a background task
+        run = await reanalysis_service.start_run(db)
+        
+        return {
+            "message": "Re-analysis started",
+            "run_id": str(run["_id"]),
+            "status": run["status"],
+            "target": run["target"],
+            "total": run["total"]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error starting re-analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to start re-analysis")
+
+
+@router.get("/reanalyze/{run_id}", response_model=ReanalysisRunResponse)
+async def get_reanalysis_run(run_id: str):
+    """Get progress of a re-analysis run"""
+    db = await get_database()
+    
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run ID")
+    
+    run = await reanalysis_service.get_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Re-analysis run not found")
+    
+    return ReanalysisRunResponse(
+        id=str(run["_id"]),
+        target=run["target"],
+        status=run["status"],
+        total=run["total"],
+        processed=run["processed"],
+        skipped=run["skipped"],
+        failed=run["failed"],
+        throughput=run.get("throughput", 0.0),
+        eta_seconds=run.get("eta_seconds"),
+        error=run.get("error"),
+        created_at=run["created_at"],
+        updated_at=run["updated_at"],
+        finished_at=run.get("finished_at")
+    )
+
+
 @router.get("/{candidate_id}", response_model=CandidateResponse)
 async def get_candidate(candidate_id: str):
     """Get candidate by ID"""
@@ -137,7 +361,7 @@ async def update_candidate(candidate_id: str, candidate_update: CandidateUpdate)
     
     try:
         # Prepare update data
-        update_data = {k: v for k, v in candidate_update.dict().items() if v is not None}
+        update_data = {k: v for k, v in candidate_update.model_dump().items() if v is not None}
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No data to update")
@@ -173,6 +397,12 @@ async def delete_candidate(candidate_id: str):
         # Delete associated matching records
         await db.matching.delete_many({"candidate_id": ObjectId(candidate_id)})
         
+        await vector_index.remove(candidate["_id"])
+        
+        # Delete the stored CV text
+        if "filehash" in candidate:
+            await text_store.delete(db, candidate["filehash"])
+        
         # Delete file
         if "cv_name" in candidate:
             await document_service.delete_file(candidate["cv_name"])
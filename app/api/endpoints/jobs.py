@@ -1,17 +1,26 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 import math
 
 from app.core.database import get_database
-from app.models.job import JobCreate, JobUpdate, JobResponse, JobListResponse
+from app.core.pagination import KEYSET_SORT, keyset_filter, split_page
+from app.core.projection import build_projection
+from app.models.job import JobCreate, JobUpdate, JobResponse, JobListResponse, JobSummary, JobWeights, SimilarCandidatesResponse, JOB_SUMMARY_FIELDS
 from app.services.ai_service import ai_service
+from app.services.matching_service import matching_service
+from app.services import prompt_builder
+from app.services.vector_index import vector_index, VECTOR_PROJECTION
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Fields a client may select with `fields=`
+JOB_FIELDS = [name for name in JobResponse.model_fields if name != "id"]
+
 
 @router.post("/", response_model=JobResponse)
 async def create_job(job_data: JobCreate):
@@ -27,6 +36,7 @@ async def create_job(job_data: JobCreate):
             "job_name": job_data.job_name.strip(),
             "job_description": job_data.job_description.strip(),
             **analysis_result,
+            "analysis_version": prompt_builder.analysis_version(analysis_result),
             "created_at": datetime.utcnow()
         }
         
@@ -42,22 +52,36 @@ async def create_job(job_data: JobCreate):
         raise HTTPException(status_code=500, detail="Failed to create job")
 
 
-@router.get("/", response_model=JobListResponse)
+@router.get("/", response_model=JobListResponse, response_model_exclude_unset=True)
 async def list_jobs(
     page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100)
+    page_size: int = Query(10, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Token from next_after; takes precedence over page"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return instead of the summary")
 ):
     """Get paginated list of jobs"""
     db = await get_database()
     
-    # Count total documents
-    total_count = await db.jobs.count_documents({})
+    # Metadata count; exact counts scan the whole collection
+    total_count = await db.jobs.estimated_document_count()
     total_pages = math.ceil(total_count / page_size)
     
-    # Get paginated results
-    skip = (page - 1) * page_size
-    cursor = db.jobs.find().skip(skip).limit(page_size).sort("created_at", -1)
-    jobs = await cursor.to_list(length=page_size)
+    # Only fetch what the page shows; created_at is needed for the next token
+    try:
+        projection = build_projection(fields, JOB_FIELDS, JOB_SUMMARY_FIELDS, required=("created_at",))
+        query = keyset_filter(after) if after else {}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if after:
+        # Keyset pagination: constant cost however deep the page
+        cursor = db.jobs.find(query, projection).sort(KEYSET_SORT).limit(page_size + 1)
+    else:
+        # Page numbers are kept for compatibility; deep pages still skip
+        skip = (page - 1) * page_size
+        cursor = db.jobs.find(query, projection).sort(KEYSET_SORT).skip(skip).limit(page_size + 1)
+    
+    jobs, next_after = split_page(await cursor.to_list(length=page_size + 1), page_size)
     
     # Convert ObjectId to string
     for job in jobs:
@@ -66,16 +90,24 @@ async def list_jobs(
     return JobListResponse(
         results=jobs,
         total_page=total_pages,
-        total_job=total_count
+        total_job=total_count,
+        next_after=next_after
     )
 
 
-@router.get("/all", response_model=List[JobResponse])
-async def get_all_jobs():
+@router.get("/all", response_model=List[JobSummary], response_model_exclude_unset=True)
+async def get_all_jobs(
+    fields: Optional[str] = Query(None, description="Comma separated fields to return besides job_name")
+):
     """Get all jobs (for dropdown selections)"""
     db = await get_database()
     
-    cursor = db.jobs.find().sort("job_name", 1)
+    try:
+        projection = build_projection(fields, JOB_FIELDS, ("job_name",), required=("job_name",))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    cursor = db.jobs.find({}, projection).sort("job_name", 1)
     jobs = await cursor.to_list(length=None)
     
     # Convert ObjectId to string
@@ -102,6 +134,41 @@ async def get_job(job_id: str):
         raise HTTPException(status_code=400, detail="Invalid job ID")
 
 
+@router.get("/{job_id}/similar-candidates", response_model=SimilarCandidatesResponse)
+async def get_similar_candidates(
+    job_id: str,
+    k: int = Query(10, ge=1, le=100, description="Number of candidates to return")
+):
+    """Candidates closest to a job's requirements in the local vector index, without the LLM"""
+    db = await get_database()
+    
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    job = await db.jobs.find_one({"_id": ObjectId(job_id)}, VECTOR_PROJECTION)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    hits = await vector_index.search(job, k)
+    
+    # One lookup for the names; candidates deleted since indexing are dropped
+    candidates = await db.candidates.find(
+        {"_id": {"$in": [ObjectId(candidate_id) for candidate_id, _ in hits]}},
+        {"candidate_name": 1, "email": 1, "cv_name": 1}
+    ).to_list(length=len(hits))
+    by_id = {str(candidate.pop("_id")): candidate for candidate in candidates}
+    
+    return SimilarCandidatesResponse(
+        job_id=job_id,
+        results=[
+            {"id": candidate_id, **by_id[candidate_id], "similarity": round(similarity, 4)}
+            for candidate_id, similarity in hits
+            if candidate_id in by_id
+        ],
+        indexed=await asyncio.to_thread(vector_index.size)
+    )
+
+
 @router.put("/{job_id}")
 async def update_job(job_id: str, job_update: JobUpdate):
     """Update job"""
@@ -114,7 +181,7 @@ async def update_job(job_id: str, job_update: JobUpdate):
             raise HTTPException(status_code=404, detail="Job not found")
         
         # Prepare update data
-        update_data = {k: v for k, v in job_update.dict().items() if v is not None}
+        update_data = {k: v for k, v in job_update.model_dump().items() if v is not None}
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No data to update")
@@ -123,6 +190,8 @@ async def update_job(job_id: str, job_update: JobUpdate):
         if "job_description" in update_data:
             analysis_result = await ai_service.analyze_job(update_data["job_description"])
             update_data.update(analysis_result)
+            # Matching records scored against the old analysis become stale
+            update_data["analysis_version"] = prompt_builder.analysis_version(analysis_result)
         
         # Update job
         result = await db.jobs.update_one(
@@ -136,6 +205,30 @@ async def update_job(job_id: str, job_update: JobUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.put("/{job_id}/weights")
+async def update_job_weights(job_id: str, weights: JobWeights):
+    """Change a job's section weights and re-rank its existing matches without the LLM"""
+    db = await get_database()
+    
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    job = await db.jobs.find_one({"_id": ObjectId(job_id)}, {"_id": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    try:
+        updated = await matching_service.set_weights(db, job["_id"], weights.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "message": "Job weights updated successfully",
+        "weights": matching_service.normalize_weights(weights.model_dump()),
+        "rescored": updated
+    }
+
+
 @router.delete("/{job_id}")
 async def delete_job(job_id: str):
     """Delete job"""
@@ -1,12 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List
-from datetime import datetime
 from bson import ObjectId
 import math
 
 from app.core.database import get_database
-from app.models.matching import ProcessMatchingRequest, MatchingResponse, MatchingDetailResponse
-from app.services.ai_service import ai_service
+from app.models.matching import ProcessMatchingRequest, MatchingResponse, MatchingDetailResponse, MatchingRunResponse
+from app.services.matching_service import matching_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,70 +14,69 @@ router = APIRouter()
 
 @router.post("/process")
 async def process_matching(request: ProcessMatchingRequest):
-    """Process matching for all candidates against a specific job"""
+    """Start matching all candidates against a specific job in the background"""
     db = await get_database()
     
+    # Find the job
+    job = await db.jobs.find_one({"job_name": request.job_name})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
     try:
-        # Find the job
-        job = await db.jobs.find_one({"job_name": request.job_name})
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        
-        # Get all candidates
-        candidates_cursor = db.candidates.find()
-        candidates = await candidates_cursor.to_list(length=None)
-        
-        processed_count = 0
-        skipped_count = 0
-        
-        for candidate in candidates:
-            # Check if matching already exists
-            existing_match = await db.matching.find_one({
-                "candidate_id": candidate["_id"],
-                "job_id": job["_id"]
-            })
-            
-            if existing_match:
-                skipped_count += 1
-                continue
-            
-            # Convert ObjectIds to strings for AI processing
-            candidate_data = {**candidate}
-            candidate_data["_id"] = str(candidate_data["_id"])
-            job_data = {**job}
-            job_data["_id"] = str(job_data["_id"])
-            
-            # Analyze matching with AI
-            matching_result = await ai_service.analyze_matching(candidate_data, job_data)
-            
-            # Prepare matching document
-            matching_doc = {
-                "candidate_id": candidate["_id"],
-                "job_id": job["_id"],
-                "degree": matching_result["degree"],
-                "experience": matching_result["experience"],
-                "technical_skill": matching_result["technical_skill"],
-                "responsibility": matching_result["responsibility"],
-                "certificate": matching_result["certificate"],
-                "soft_skill": matching_result["soft_skill"],
-                "summary_comment": matching_result["summary_comment"],
-                "score": matching_result["score"],
-                "created_at": datetime.utcnow()
-            }
-            
-            # Save to database
-            await db.matching.insert_one(matching_doc)
-            processed_count += 1
+        # Persist the run and hand it to a background task
+        run = await matching_service.start_run(
+            db,
+            job,
+            request.candidates_per_prompt,
+            shortlist_k=request.shortlist_k,
+            min_prefilter_score=request.min_prefilter_score
+        )
         
         return {
-            "message": "Matching process completed",
-            "processed": processed_count,
-            "skipped": skipped_count
+            "message": "Matching process started",
+            "run_id": str(run["_id"]),
+            "status": run["status"]
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing matching: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to process matching")
+        logger.error(f"Error starting matching: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to start matching")
+
+
+@router.get("/runs/{run_id}", response_model=MatchingRunResponse)
+async def get_matching_run(run_id: str):
+    """Get progress of a matching run"""
+    db = await get_database()
+    
+    if not ObjectId.is_valid(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run ID")
+    
+    run = await matching_service.get_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Matching run not found")
+    
+    return MatchingRunResponse(
+        id=str(run["_id"]),
+        job_id=str(run["job_id"]),
+        job_name=run["job_name"],
+        status=run["status"],
+        total=run["total"],
+        processed=run["processed"],
+        skipped=run["skipped"],
+        failed=run["failed"],
+        prefiltered=run.get("prefiltered", 0),
+        shortlist_k=run.get("shortlist_k"),
+        min_prefilter_score=run.get("min_prefilter_score"),
+        prefilter_threshold=run.get("prefilter_threshold"),
+        throughput=run.get("throughput", 0.0),
+        eta_seconds=run.get("eta_seconds"),
+        error=run.get("error"),
+        created_at=run["created_at"],
+        updated_at=run["updated_at"],
+        finished_at=run.get("finished_at")
+    )
 
 
 @router.get("/results")
@@ -96,39 +94,91 @@ async def get_matching_results(
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        # Get all candidates with their matching scores
-        candidates_cursor = db.candidates.find()
-        candidates = await candidates_cursor.to_list(length=None)
+        skip = (page - 1) * page_size
         
-        results = []
-        for candidate in candidates:
-            # Find matching record
-            matching = await db.matching.find_one({
-                "candidate_id": candidate["_id"],
-                "job_id": job["_id"]
-            })
-            
-            result = {
-                "id": str(candidate["_id"]),
+        # Matched candidates come first, ranked by score inside MongoDB;
+        # prefiltered ones have no score and sort after them
+        total_matched = await db.matching.count_documents({"job_id": job["_id"]})
+        matched_cursor = db.matching.aggregate([
+            {"$match": {"job_id": job["_id"]}},
+            {"$sort": {"score": -1, "candidate_id": 1}},
+            {"$skip": skip},
+            {"$limit": page_size},
+            {"$lookup": {
+                "from": "candidates",
+                "localField": "candidate_id",
+                "foreignField": "_id",
+                "as": "candidate"
+            }},
+            {"$unwind": "$candidate"},
+            {"$project": {
+                "_id": 0,
+                "candidate_id": 1,
+                "score": 1,
+                "summary_comment": 1,
+                "prefiltered": 1,
+                "candidate.candidate_name": 1,
+                "candidate.email": 1,
+                "candidate.phone_number": 1,
+                "candidate.cv_name": 1
+            }}
+        ])
+        
+        paginated_results = []
+        async for matching in matched_cursor:
+            candidate = matching["candidate"]
+            paginated_results.append({
+                "id": str(matching["candidate_id"]),
                 "candidate_name": candidate.get("candidate_name", "Unknown"),
                 "candidate_email": candidate.get("email", ""),
                 "candidate_phone": candidate.get("phone_number", ""),
                 "cv_name": candidate.get("cv_name", ""),
-                "score": matching["score"] if matching else 0,
-                "summary_comment": matching["summary_comment"] if matching else "",
-                "matching_status": matching is not None
-            }
-            results.append(result)
+                "score": matching["score"] or 0,
+                "summary_comment": matching["summary_comment"],
+                "matching_status": not matching.get("prefiltered", False),
+                "prefiltered": matching.get("prefiltered", False)
+            })
         
-        # Sort by score (highest first)
-        results.sort(key=lambda x: x["score"], reverse=True)
+        # Pages past the matched records are filled with not-yet-matched candidates
+        if len(paginated_results) < page_size:
+            pending_skip = max(0, skip - total_matched)
+            # Streams candidates from the _id index, probing only this job's record for each
+            pending_cursor = db.candidates.aggregate([
+                {"$sort": {"_id": 1}},
+                {"$lookup": {
+                    "from": "matching",
+                    "let": {"candidate_id": "$_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$and": [
+                            {"$eq": ["$candidate_id", "$$candidate_id"]},
+                            {"$eq": ["$job_id", job["_id"]]}
+                        ]}}},
+                        {"$limit": 1},
+                        {"$project": {"_id": 1}}
+                    ],
+                    "as": "matching"
+                }},
+                {"$match": {"matching": {"$size": 0}}},
+                {"$skip": pending_skip},
+                {"$limit": page_size - len(paginated_results)},
+                {"$project": {"candidate_name": 1, "email": 1, "phone_number": 1, "cv_name": 1}}
+            ])
+            async for candidate in pending_cursor:
+                paginated_results.append({
+                    "id": str(candidate["_id"]),
+                    "candidate_name": candidate.get("candidate_name", "Unknown"),
+                    "candidate_email": candidate.get("email", ""),
+                    "candidate_phone": candidate.get("phone_number", ""),
+                    "cv_name": candidate.get("cv_name", ""),
+                    "score": 0,
+                    "summary_comment": "",
+                    "matching_status": False,
+                    "prefiltered": False
+                })
         
-        # Paginate results
-        total_count = len(results)
+        # Every candidate appears in the ranking, matched or not
+        total_count = max(await db.candidates.estimated_document_count(), total_matched)
         total_pages = math.ceil(total_count / page_size)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_results = results[start_idx:end_idx]
         
         return {
             "results": paginated_results,
@@ -163,7 +213,7 @@ async def get_matching_detail(candidate_id: str, job_id: str):
             "job_id": ObjectId(job_id)
         })
         
-        if not matching:
+        if not matching or matching.get("prefiltered"):
             # Return candidate info without matching details
             return MatchingDetailResponse(
                 id=str(candidate["_id"]),
@@ -174,7 +224,7 @@ async def get_matching_detail(candidate_id: str, job_id: str):
                 job_name=job.get("job_name", ""),
                 job_recommended=candidate.get("job_recommended", []),
                 score=0,
-                summary_comment="No matching analysis available",
+                summary_comment=matching["summary_comment"] if matching else "No matching analysis available",
                 degree={"score": 0, "comment": "Not analyzed"},
                 experience={"score": 0, "comment": "Not analyzed"},
                 technical_skill={"score": 0, "comment": "Not analyzed"},
@@ -13,17 +13,76 @@ class Settings(BaseSettings):
     
     # Database
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017/resume_ranking")
+    DB_CREATE_INDEXES: bool = True  # Build indexes in the background at startup; else run `python -m app.migrate`
+    READY_TIMEOUT: float = 2.0  # Seconds /ready waits for a MongoDB ping
     
     # AI Configuration
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    GEMINI_MODEL: str = "gemini-1.5-flash"
+    GEMINI_MAX_CONCURRENCY: int = 8  # Max in-flight Gemini calls per process
+    GEMINI_TIMEOUT: float = 120.0  # Seconds before a single Gemini call is abandoned
+    GEMINI_RATE_LIMIT: float = 10.0  # Max requests per second; lowered automatically on 429s
+    GEMINI_RATE_BURST: int = 10
+    GEMINI_MIN_RATE: float = 0.5  # Floor the adaptive limiter never goes below
+    GEMINI_MAX_RETRIES: int = 5  # Retries of a transient error (429, 5xx, timeout)
+    GEMINI_BACKOFF_BASE: float = 1.0  # Seconds; doubled per retry with full jitter
+    GEMINI_BACKOFF_MAX: float = 30.0
+    GEMINI_RETRY_DEADLINE: float = 180.0  # Seconds a call may spend retrying overall
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive transient failures that open the circuit
+    GEMINI_CIRCUIT_RESET_TIMEOUT: float = 30.0  # Seconds the circuit stays open before a probe
+    
+    # Offline fake Gemini, for local development and load testing
+    GEMINI_FAKE: bool = False
+    GEMINI_FAKE_LATENCY: float = 0.05  # Seconds per fake call
+    GEMINI_FAKE_FAILURE_RATE: float = 0.0  # Fraction of fake calls that fail with 503
+    GEMINI_FAKE_QUOTA: float = 0  # Fake calls allowed per second before 429s, 0 means unlimited
+    
+    # Prompt token budgets for the variable part of each prompt
+    CANDIDATE_PROMPT_TOKEN_BUDGET: int = 6000  # CV text
+    JOB_PROMPT_TOKEN_BUDGET: int = 3000  # Job description
+    MATCHING_PROMPT_TOKEN_BUDGET: int = 1500  # Job requirements plus candidate profile
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 2048  # Entries kept in the in-process LRU
+    LLM_CACHE_TTL: int = 30 * 24 * 3600  # Seconds before a MongoDB cache entry expires
+    
+    # Matching
+    MATCHING_BATCH_SIZE: int = 100  # Candidates per lookup / bulk insert round-trip
+    MATCHING_CANDIDATES_PER_PROMPT: int = 5  # Candidates scored per Gemini call, 1 disables batching
+    
+    # Background matching and re-analysis runs
+    RUN_LEASE_SECONDS: float = 60.0  # A run whose worker stops renewing this long is taken over by another
+    
+    # Bulk candidate re-analysis after a prompt or model change
+    REANALYSIS_BATCH_SIZE: int = 50  # Candidates per checkpoint
+    REANALYSIS_CONCURRENCY: int = 4  # Candidates analyzed at once, leaving Gemini capacity for uploads
+    
+    # Local candidate similarity index, no network model
+    VECTOR_INDEX_DIR: str = "data/vector_index"  # Memory-mapped vector files, shared by the workers of a host
+    VECTOR_DIM: int = 512  # Hashed feature dimensions; changing it resets and rebuilds the index
     
     # File upload
     UPLOAD_DIR: str = "uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CONCURRENCY: int = 8  # Files extracted/analyzed/stored at once per upload request
+    
+    # Document text extraction
+    EXTRACTION_WORKERS: int = 0  # Extraction processes, 0 means one per CPU core
+    EXTRACTION_TIMEOUT: float = 30.0  # Seconds before a single file's extraction is killed
+    EXTRACTION_MAX_PAGES: int = 5  # PDF pages read per file, 0 means all
+    EXTRACTION_MAX_CHARS: int = 30000  # Characters kept per file, 0 means all
     
     # Logging
     LOG_LEVEL: str = "INFO"
     
+    # Observability
+    METRICS_ENABLED: bool = True  # Per-request timing for the Prometheus /metrics endpoint
+    TRACING_ENABLED: bool = True  # Request spans kept in process, see /debug/traces/{trace_id}
+    TRACE_SAMPLE_RATE: float = 0.1  # Fraction of requests traced unless the caller's traceparent says sampled
+    TRACE_BUFFER_SIZE: int = 10000  # Finished spans kept in memory
+    PROFILE_INTERVAL: float = 0.005  # Seconds between stack samples for ?profile=1 (not in production)
+    
     class Config:
         env_file = ".env"
 
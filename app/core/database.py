@@ -1,5 +1,7 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+from app.core.tracing import TracedDatabase
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,42 +9,108 @@ logger = logging.getLogger(__name__)
 class Database:
     client: AsyncIOMotorClient = None
     database = None
+    indexes_ready: bool = False
 
 db = Database()
 
 async def get_database():
-    return db.database
+    if db.database is None or not settings.TRACING_ENABLED:
+        return db.database
+    # Records queries as spans of the current request's trace
+    return TracedDatabase(db.database)
 
 async def init_db():
-    """Initialize database connection"""
+    """Create the database client.
+
+    Motor connects in the background, so this does no I/O and startup does not
+    wait for MongoDB; /ready reports when it answers.
+    """
+    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db.database = db.client.get_default_database()
+
+async def ping_db(timeout: float) -> bool:
+    """Whether MongoDB answers a ping within the timeout"""
     try:
-        db.client = AsyncIOMotorClient(settings.MONGODB_URL)
-        db.database = db.client.get_default_database()
-        
-        # Test connection
-        await db.client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB")
-        
-        # Create indexes
-        await create_indexes()
-        
+        await asyncio.wait_for(db.client.admin.command('ping'), timeout=timeout)
+        return True
     except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {e}")
-        raise
+        logger.warning(f"MongoDB ping failed: {str(e) or type(e).__name__}")
+        return False
 
 async def create_indexes():
-    """Create database indexes"""
+    """Create database indexes, a no-op for indexes that already exist.
+
+    Run in the background at startup when DB_CREATE_INDEXES is set, otherwise
+    as a deploy step with `python -m app.migrate`.
+    """
     try:
         # Create indexes for better performance
         await db.database.candidates.create_index("email")
-        await db.database.candidates.create_index("created_at")
+        await db.database.candidates.create_index([("created_at", -1), ("_id", -1)])
+        await db.database.candidates.create_index("skill_terms")
         await db.database.jobs.create_index("job_name")
-        await db.database.jobs.create_index("created_at")
-        await db.database.matching.create_index([("candidate_id", 1), ("job_id", 1)])
+        await db.database.jobs.create_index([("created_at", -1), ("_id", -1)])
+        await db.database.matching.create_index([("job_id", 1), ("score", -1), ("candidate_id", 1)])
+        await db.database.matching_runs.create_index([("status", 1), ("job_id", 1)])
+        await db.database.reanalysis_runs.create_index("status")
+        await db.database.llm_cache.create_index("created_at", expireAfterSeconds=settings.LLM_CACHE_TTL)
         
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.error(f"Failed to create indexes: {e}")
+        return
+    
+    ready = True
+    try:
+        # Unique so duplicate uploads are rejected by the database itself
+        await db.database.candidates.create_index("filehash", unique=True)
+    except Exception as e:
+        logger.error(f"Failed to create unique filehash index, remove duplicate candidates first: {e}")
+        ready = False
+    
+    try:
+        # One record per pair, even if two workers ever score the same candidate
+        await _create_unique_index(db.database.matching, [("candidate_id", 1), ("job_id", 1)])
+    except Exception as e:
+        logger.error(f"Failed to create unique matching index: {e}")
+        ready = False
+    
+    db.indexes_ready = ready
+
+async def _create_unique_index(collection, keys: list):
+    """Create a unique index, replacing a non-unique one on the same keys.
+
+    Duplicates are removed first so the unique build can succeed before the
+    old index is dropped; if documents written meanwhile still collide, the
+    non-unique index is put back so lookups on these keys stay indexed.
+    """
+    existing = [index for index in (await collection.index_information()).values() if list(index["key"]) == keys]
+    if any(index.get("unique") for index in existing):
+        return
+
+    removed = await _remove_duplicates(collection, keys)
+    if removed:
+        logger.warning(f"Removed {removed} duplicate documents from {collection.name} before adding a unique index")
+
+    if existing:
+        await collection.drop_index(keys)
+    try:
+        await collection.create_index(keys, unique=True)
+    except Exception:
+        await collection.create_index(keys)
+        raise
+
+async def _remove_duplicates(collection, keys: list) -> int:
+    """Delete all but the newest document of each group sharing the given keys"""
+    pipeline = [
+        {"$group": {"_id": {field: f"${field}" for field, _ in keys}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    removed = 0
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        result = await collection.delete_many({"_id": {"$in": sorted(group["ids"])[:-1]}})
+        removed += result.deleted_count
+    return removed
 
 async def close_db():
     """Close database connection"""
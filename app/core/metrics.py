@@ -0,0 +1,90 @@
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Buckets in seconds: sub-millisecond API reads up to minute-long uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+FILE_SIZE_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served")
+
+# Gemini
+GEMINI_REQUEST_DURATION = Histogram(
+    "gemini_request_duration_seconds", "Latency of single Gemini calls, retries counted separately",
+    ["operation", "outcome"], buckets=LATENCY_BUCKETS
+)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Gemini tokens used", ["operation", "direction"])
+GEMINI_RETRIES = Counter("gemini_retries_total", "Gemini calls retried after a transient error", ["operation", "error"])
+GEMINI_ERRORS = Counter("gemini_errors_total", "Gemini calls that failed for good", ["operation", "error"])
+GEMINI_IN_FLIGHT = Gauge("gemini_requests_in_flight", "Gemini calls awaiting a reply")
+GEMINI_CIRCUIT_OPEN = Gauge("gemini_circuit_open", "1 while the Gemini circuit breaker refuses calls")
+GEMINI_RATE_LIMIT = Gauge("gemini_rate_limit", "Current adaptive Gemini request rate per second")
+
+# LLM response cache
+LLM_CACHE_LOOKUPS = Counter("llm_cache_lookups_total", "LLM cache lookups by the tier that answered", ["result"])
+LLM_CACHE_ENTRIES = Gauge("llm_cache_entries", "Responses held in the in-process LRU")
+
+# Text extraction
+EXTRACTION_DURATION = Histogram(
+    "extraction_duration_seconds", "Text extraction time per file",
+    ["file_type", "outcome"], buckets=LATENCY_BUCKETS
+)
+EXTRACTION_BYTES = Histogram(
+    "extraction_file_bytes", "Size of files sent to text extraction",
+    ["file_type"], buckets=FILE_SIZE_BUCKETS
+)
+EXTRACTIONS_IN_FLIGHT = Gauge("extractions_in_flight", "Files being extracted in the process pool")
+
+# Matching
+MATCHING_PAIRS = Counter("matching_pairs_total", "Candidate-job pairs handled by matching runs", ["result"])
+MATCHING_BATCH_DURATION = Histogram(
+    "matching_batch_duration_seconds", "Time to score and store one matching batch",
+    buckets=LATENCY_BUCKETS
+)
+MATCHING_RUNS_ACTIVE = Gauge("matching_runs_active", "Matching runs executing in this process")
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Serialize every metric in the Prometheus text format"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing each HTTP request.
+
+    Labels use the matched route template, not the raw path, so ids in URLs do
+    not create new series. Streaming responses are timed until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code)
+            ).observe(time.perf_counter() - started)
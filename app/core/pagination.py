@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+
+# Newest first, with _id breaking ties between documents created in the same millisecond
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+
+def encode_cursor(doc: dict) -> str:
+    """Build an opaque `after` token pointing just past a document"""
+    payload = {"c": doc["created_at"].isoformat(), "i": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, ObjectId]:
+    """Parse an `after` token, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        return datetime.fromisoformat(payload["c"]), ObjectId(payload["i"])
+    except Exception:
+        raise ValueError("Invalid pagination token")
+
+
+def keyset_filter(token: str) -> dict:
+    """Query matching the documents that sort after the token under KEYSET_SORT"""
+    created_at, _id = decode_cursor(token)
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": _id}}
+        ]
+    }
+
+
+def split_page(docs: list, page_size: int) -> Tuple[list, Optional[str]]:
+    """Trim a result fetched with limit page_size + 1 and build the next token"""
+    if len(docs) <= page_size:
+        return docs, None
+    docs = docs[:page_size]
+    return docs, encode_cursor(docs[-1])
@@ -0,0 +1,55 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread at a fixed interval.
+
+    Defaults to the calling thread, which for a request handler is the event
+    loop, so samples include whatever else the loop runs meanwhile. The report
+    uses the collapsed stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._elapsed = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self._samples[";".join(reversed(stack))] += 1
+
+    def report(self) -> dict:
+        """Sample counts per collapsed stack, root frame first, busiest stacks first"""
+        return {
+            "interval_ms": self.interval * 1000,
+            "duration_ms": round(self._elapsed * 1000, 3),
+            "samples": sum(self._samples.values()),
+            "folded": [f"{stack} {count}" for stack, count in self._samples.most_common()]
+        }
@@ -0,0 +1,19 @@
+from typing import Iterable, Optional
+
+
+def build_projection(fields: Optional[str], allowed: Iterable[str], default: Iterable[str], required: Iterable[str] = ()) -> dict:
+    """Turn a comma separated `fields=` parameter into a Mongo projection.
+
+    Falls back to the default fieldset when no fields are requested and raises
+    ValueError for names the response model does not know. Required fields are
+    always included (e.g. the keys pagination tokens are built from).
+    """
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = sorted(set(requested) - set(allowed))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        requested = list(default)
+
+    return {name: 1 for name in [*requested, *required]}
@@ -0,0 +1,382 @@
+import inspect
+import json
+import random
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+
+from app.core.config import settings
+from app.core.profiling import SamplingProfiler
+
+# W3C trace context header, understood by OpenTelemetry and most tracing proxies
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "x-trace-id"
+
+# Motor methods returning a cursor rather than an awaitable
+CURSOR_METHODS = {"find", "aggregate", "list_indexes"}
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace, exported in the OTLP JSON field layout"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes",
+                 "start_time_unix_nano", "end_time_unix_nano", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        self.status = "UNSET"
+        self.status_message = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.status_message = str(error) or type(error).__name__
+        self.attributes["error.type"] = type(error).__name__
+
+    def end(self):
+        self.end_time_unix_nano = time.time_ns()
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        end = self.end_time_unix_nano or time.time_ns()
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": end,
+            "duration_ms": round((end - self.start_time_unix_nano) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message}
+        }
+
+
+class InMemorySpanExporter:
+    """Keeps the most recent finished spans in process, oldest dropped first"""
+
+    def __init__(self, max_spans: int):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def get_trace(self, trace_id: str) -> list[dict]:
+        """Spans of one trace in start order"""
+        spans = [span for span in self._spans if span.trace_id == trace_id]
+        return [span.to_dict() for span in sorted(spans, key=lambda s: s.start_time_unix_nano)]
+
+    def clear(self):
+        self._spans.clear()
+
+
+exporter = InMemorySpanExporter(settings.TRACE_BUFFER_SIZE)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    """Return (trace_id, parent_span_id, sampled) from a traceparent header, None if malformed"""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """Add attributes to the active span, if any"""
+    active = _current_span.get()
+    if active is not None:
+        active.attributes.update(attributes)
+
+
+def detach():
+    """Stop recording under the inherited trace, e.g. in a task outliving its request"""
+    _current_span.set(None)
+
+
+@contextmanager
+def _activate(span: Span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        exporter.export(span)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child of the active span; a no-op outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    with _activate(Span(name, parent.trace_id, parent.span_id, attributes)) as child:
+        yield child
+
+
+@contextmanager
+def start_trace(name: str, traceparent: Optional[str] = None, force: bool = False, **attributes):
+    """Start a root span, continuing the caller's trace when a traceparent is given.
+
+    Yields None when the trace is not sampled, so nothing below it is recorded.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_span_id, sampled = parent
+    else:
+        trace_id, parent_span_id = secrets.token_hex(16), None
+        sampled = random.random() < settings.TRACE_SAMPLE_RATE
+
+    if not force and not (settings.TRACING_ENABLED and sampled):
+        token = _current_span.set(None)
+        try:
+            yield None
+        finally:
+            _current_span.reset(token)
+        return
+
+    with _activate(Span(name, trace_id, parent_span_id, attributes)) as root:
+        yield root
+
+
+async def _traced_await(awaitable, name: str, attributes: dict):
+    with span(name, **attributes):
+        return await awaitable
+
+
+class TracedCursor:
+    """Motor cursor proxy recording to_list() and ``async for`` as a span"""
+
+    def __init__(self, cursor, name: str, attributes: dict):
+        self._cursor = cursor
+        self._name = name
+        self._attributes = attributes
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        if name == "to_list":
+            def to_list(*args, **kwargs):
+                return _traced_await(attr(*args, **kwargs), self._name, self._attributes)
+            return to_list
+
+        # Keep chained calls like .sort().limit() on the proxy
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return chained
+
+    def __aiter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            return self._cursor.__aiter__()
+        return self._traced_iter(Span(self._name, parent.trace_id, parent.span_id, self._attributes))
+
+    async def _traced_iter(self, cursor_span: Span):
+        """Yield the documents inside one span, from the first fetch until the loop ends.
+
+        The span is not made current, so spans opened by the loop body stay
+        children of the caller's span.
+        """
+        count = 0
+        try:
+            async for document in self._cursor:
+                count += 1
+                yield document
+        except Exception as e:
+            cursor_span.record_error(e)
+            raise
+        finally:
+            cursor_span.set_attribute("db.documents", count)
+            cursor_span.end()
+            exporter.export(cursor_span)
+
+
+class TracedCollection:
+    """Motor collection proxy recording each awaited call as a span"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        span_name = f"mongodb.{self._collection.name}.{name}"
+        attributes = {"db.system": "mongodb", "db.mongodb.collection": self._collection.name, "db.operation": name}
+
+        if name in CURSOR_METHODS:
+            def cursor_method(*args, **kwargs):
+                return TracedCursor(attr(*args, **kwargs), span_name, attributes)
+            return cursor_method
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if _current_span.get() is None or not inspect.isawaitable(result):
+                return result
+            return _traced_await(result, span_name, attributes)
+        return method
+
+
+class TracedDatabase:
+    """Motor database proxy handing out traced collections"""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if hasattr(attr, "find_one"):
+            return TracedCollection(attr)
+        return attr
+
+    def __getitem__(self, name):
+        return TracedCollection(self._database[name])
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+def _finish_root(root: Span, scope, status_code: int):
+    route = scope.get("route")
+    root.name = _route_name(scope)
+    if route is not None:
+        root.set_attribute("http.route", route.path)
+    root.set_attribute("http.status_code", status_code)
+    if status_code >= 500:
+        root.status = "ERROR"
+
+
+def _wants_profile(scope) -> bool:
+    if settings.APP_ENV == "production":
+        return False
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[0] in ("1", "true")
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening a root span per HTTP request.
+
+    Continues the trace of an incoming traceparent header and returns the
+    request's own traceparent and X-Trace-Id, so its spans can be fetched from
+    /debug/traces/{trace_id}. Outside production `?profile=1` samples the
+    event loop thread during the request and answers with the spans and the
+    sampled stacks instead of the normal response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if _wants_profile(scope):
+            await self._profile(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        traceparent = headers.get(TRACEPARENT_HEADER.encode(), b"").decode("latin-1")
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+
+        with start_trace(_route_name(scope), traceparent, **attributes) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            status_code = 500
+
+            async def send_wrapper(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    message = {**message, "headers": [*message.get("headers", []), *self._trace_headers(root)]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _finish_root(root, scope, status_code)
+
+    async def _profile(self, scope, receive, send):
+        """Run the request under the sampling profiler and return the breakdown as JSON"""
+        status_code = 500
+
+        async def discard(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler = SamplingProfiler(settings.PROFILE_INTERVAL)
+        attributes = {"http.method": scope["method"], "http.target": scope["path"], "profile": True}
+        profiler.start()
+        try:
+            with start_trace(_route_name(scope), force=True, **attributes) as root:
+                try:
+                    await self.app(scope, receive, discard)
+                finally:
+                    _finish_root(root, scope, status_code)
+        finally:
+            profiler.stop()
+
+        body = json.dumps({
+            "trace_id": root.trace_id,
+            "status_code": status_code,
+            "spans": exporter.get_trace(root.trace_id),
+            "profile": profiler.report()
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *self._trace_headers(root)
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _trace_headers(root: Span) -> list[tuple[bytes, bytes]]:
+        return [(TRACEPARENT_HEADER.encode(), root.traceparent().encode()), (TRACE_ID_HEADER.encode(), root.trace_id.encode())]
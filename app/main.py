@@ -1,21 +1,61 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import create_indexes, db as database, get_database, init_db, ping_db
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core import tracing
+from app.services.ai_service import ai_service
+from app.services.document_service import document_service
+from app.services.matching_service import matching_service
+from app.services.reanalysis_service import reanalysis_service
+from app.services.skill_service import skill_service
+from app.services.vector_index import vector_index
 from app.api.routes import api_router
 
+logger = logging.getLogger(__name__)
+
+
+async def _log_failure(coro, what: str):
+    """Await startup work running in the background, logging rather than losing its error"""
+    try:
+        await coro
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"{what} failed: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup does no I/O so workers accept requests at once; /ready says when they can serve them
     await init_db()
+    db = await get_database()
+    
+    background_tasks = [
+        # Resume runs of stopped workers, now and whenever another worker dies
+        asyncio.create_task(_log_failure(matching_service.supervise(db), "Matching run supervision")),
+        asyncio.create_task(_log_failure(reanalysis_service.supervise(db), "Re-analysis run supervision")),
+        # Normalize skills of older candidates
+        asyncio.create_task(_log_failure(skill_service.backfill(db), "Skill backfill")),
+        # First start, or VECTOR_DIM changed: index existing candidates
+        asyncio.create_task(_log_failure(vector_index.ensure_built(db), "Vector index build"))
+    ]
+    if settings.DB_CREATE_INDEXES:
+        background_tasks.append(asyncio.create_task(_log_failure(create_indexes(), "Index creation")))
     yield
     # Shutdown
-    pass
+    for task in background_tasks:
+        task.cancel()
+    # Hand runs over to the remaining workers without waiting for their leases to expire
+    await asyncio.gather(matching_service.shutdown(), reanalysis_service.shutdown())
+    document_service.shutdown()
 
 
 # Create FastAPI app
@@ -35,6 +75,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request for /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Root span per request; outermost so it also covers the metrics middleware
+app.add_middleware(tracing.TracingMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
@@ -50,4 +97,40 @@ async def root(request: Request):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "resume-ranking"}
\ No newline at end of file
+    """Liveness: the process serves requests, whatever the state of its dependencies"""
+    return {"status": "healthy", "service": "resume-ranking"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: MongoDB answers and Gemini is configured"""
+    checks = {
+        "database": await ping_db(settings.READY_TIMEOUT),
+        "ai_service": ai_service.configured
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not ready",
+            "checks": checks,
+            # Informational: queries work without indexes, only slower
+            "indexes_ready": database.indexes_ready
+        }
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/debug/traces/{trace_id}", include_in_schema=False)
+async def get_trace(trace_id: str):
+    """Spans of a recent trace, as returned in the X-Trace-Id header"""
+    spans = tracing.exporter.get_trace(trace_id.lower())
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id.lower(), "spans": spans}
@@ -0,0 +1,36 @@
+"""Create MongoDB indexes as a deploy step.
+
+    python -m app.migrate [--rebuild-vectors]
+
+Use with DB_CREATE_INDEXES=false so workers never build indexes themselves.
+--rebuild-vectors also re-indexes every candidate in the local similarity
+index, e.g. after restoring the database.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.core.config import settings
+from app.core.database import close_db, create_indexes, db, get_database, init_db
+
+
+async def migrate(rebuild_vectors: bool = False) -> bool:
+    await init_db()
+    try:
+        await create_indexes()
+        if rebuild_vectors:
+            from app.services.vector_index import vector_index
+            await vector_index.rebuild(await get_database())
+    finally:
+        await close_db()
+    return db.indexes_ready
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes")
+    parser.add_argument("--rebuild-vectors", action="store_true", help="Rebuild the candidate similarity index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    sys.exit(0 if asyncio.run(migrate(args.rebuild_vectors)) else 1)
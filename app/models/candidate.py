@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import core_schema
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
@@ -6,8 +7,11 @@ from bson import ObjectId
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str)
+        )
 
     @classmethod
     def validate(cls, v):
@@ -16,8 +20,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class CandidateBase(BaseModel):
@@ -34,6 +38,7 @@ class CandidateBase(BaseModel):
     job_recommended: List[str] = []
     office: int = 0
     sql: int = 0
+    skill_terms: List[str] = []
 
 
 class CandidateCreate(CandidateBase):
@@ -53,18 +58,70 @@ class CandidateInDB(CandidateBase):
     cv_name: str
     filehash: str
     created_at: datetime
+    analysis_version: Optional[str] = None
+    analysis_prompt_version: Optional[str] = None
+    analysis_model: Optional[str] = None
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
 class CandidateResponse(CandidateInDB):
     pass
 
 
+class CandidateSummary(BaseModel):
+    """Slim candidate row for listings; any extra requested fields pass through.
+
+    Routes return it with response_model_exclude_unset, so fields left out of
+    the projection are omitted rather than null.
+    """
+    id: str = Field(alias="_id")
+    candidate_name: Optional[str] = None
+    email: Optional[str] = None
+    cv_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(populate_by_name=True, extra="allow")
+
+
+# Fields a listing shows unless the client asks for others with `fields=`
+CANDIDATE_SUMMARY_FIELDS = ("candidate_name", "email", "cv_name", "created_at")
+
+
 class CandidateListResponse(BaseModel):
-    results: List[CandidateResponse]
+    results: List[CandidateSummary]
     total_page: int
-    total_file: int
\ No newline at end of file
+    total_file: int
+    next_after: Optional[str] = None
+
+
+class CandidateSearchResult(BaseModel):
+    id: str
+    candidate_name: str
+    email: str
+    cv_name: str
+    matched_skills: List[str]
+    overlap: int
+
+
+class CandidateSearchResponse(BaseModel):
+    results: List[CandidateSearchResult]
+    skills: List[str]
+    total_page: int
+    total_file: int
+
+
+class ReanalysisRunResponse(BaseModel):
+    id: str
+    target: dict
+    status: str
+    total: int
+    processed: int
+    skipped: int
+    failed: int
+    throughput: float = 0.0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
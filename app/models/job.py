@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import core_schema
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
@@ -6,8 +7,11 @@ from bson import ObjectId
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str)
+        )
 
     @classmethod
     def validate(cls, v):
@@ -16,8 +20,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class JobBase(BaseModel):
@@ -31,6 +35,16 @@ class JobBase(BaseModel):
     soft_skill: List[str] = []
 
 
+class JobWeights(BaseModel):
+    """Relative weight of each matching section; normalized to sum to 1 when saved"""
+    degree: float = Field(..., ge=0)
+    experience: float = Field(..., ge=0)
+    technical_skill: float = Field(..., ge=0)
+    responsibility: float = Field(..., ge=0)
+    certificate: float = Field(..., ge=0)
+    soft_skill: float = Field(..., ge=0)
+
+
 class JobCreate(BaseModel):
     job_name: str
     job_description: str
@@ -44,18 +58,49 @@ class JobUpdate(BaseModel):
 class JobInDB(JobBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     created_at: datetime
+    analysis_version: Optional[str] = None
+    weights: Optional[JobWeights] = None
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
 class JobResponse(JobInDB):
     pass
 
 
+class JobSummary(BaseModel):
+    """Slim job row for listings and dropdowns; any extra requested fields pass through.
+
+    Routes return it with response_model_exclude_unset, so fields left out of
+    the projection are omitted rather than null.
+    """
+    id: str = Field(alias="_id")
+    job_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(populate_by_name=True, extra="allow")
+
+
+# Fields a listing shows unless the client asks for others with `fields=`
+JOB_SUMMARY_FIELDS = ("job_name", "created_at")
+
+
 class JobListResponse(BaseModel):
-    results: List[JobResponse]
+    results: List[JobSummary]
     total_page: int
-    total_job: int
\ No newline at end of file
+    total_job: int
+    next_after: Optional[str] = None
+
+
+class SimilarCandidate(BaseModel):
+    id: str
+    candidate_name: Optional[str] = None
+    email: Optional[str] = None
+    cv_name: Optional[str] = None
+    similarity: float
+
+
+class SimilarCandidatesResponse(BaseModel):
+    job_id: str
+    results: List[SimilarCandidate]
+    indexed: int
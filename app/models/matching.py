@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import core_schema
 from typing import Optional
 from datetime import datetime
 from bson import ObjectId
@@ -6,8 +7,11 @@ from bson import ObjectId
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str)
+        )
 
     @classmethod
     def validate(cls, v):
@@ -16,8 +20,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class ScoreComment(BaseModel):
@@ -46,10 +50,7 @@ class MatchingInDB(MatchingBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     created_at: datetime
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
 class MatchingResponse(MatchingInDB):
@@ -75,4 +76,29 @@ class MatchingDetailResponse(BaseModel):
 
 
 class ProcessMatchingRequest(BaseModel):
-    job_name: str
\ No newline at end of file
+    job_name: str
+    candidates_per_prompt: Optional[int] = Field(None, ge=1, le=20)
+    # Only the top candidates by local similarity go to Gemini; the rest are recorded as prefiltered
+    shortlist_k: Optional[int] = Field(None, ge=1)
+    min_prefilter_score: Optional[float] = Field(None, ge=0, le=1)
+
+
+class MatchingRunResponse(BaseModel):
+    id: str
+    job_id: str
+    job_name: str
+    status: str
+    total: int
+    processed: int
+    skipped: int
+    failed: int
+    prefiltered: int = 0
+    shortlist_k: Optional[int] = None
+    min_prefilter_score: Optional[float] = None
+    prefilter_threshold: Optional[float] = None
+    throughput: float = 0.0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
\ No newline at end of file
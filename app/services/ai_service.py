@@ -1,22 +1,242 @@
+import asyncio
 import json
 import os
 import logging
-import google.generativeai as genai
+import random
+import time
+from typing import Optional
+from google.api_core import exceptions as google_exceptions
 from app.core.config import settings
+from app.core import metrics, tracing
+from app.services.cache_service import LLMCache
+from app.services.fake_gemini import FakeGeminiModel
+from app.services.rate_limiter import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError
+from app.services import prompt_builder
 
 logger = logging.getLogger(__name__)
 
+# Bump when a prompt changes so cached responses from the old prompt are not reused
+CANDIDATE_PROMPT_VERSION = "1"
+JOB_PROMPT_VERSION = "1"
+MATCHING_PROMPT_VERSION = "2"
+
+MATCHING_SYSTEM_PROMPT = """
+Scoring Guide:
+It's ok to say candidate does not match the requirement.
+Degree Section: Prioritize major than degree level. Candidate with degrees more directly relevant to the required degree should receive higher score, even if their degree level is lower.
+Experience Section: Candidate with more relevant experience field get higher score.
+Technical Skills Section: Candidate with more relevant technical skills get higher score.
+Responsibilities Section: Candidate with more relevant responsibilities get higher score.
+Certificates Section: Candidate with required certificates get higher score. Candidate without required certificates get no score. Candidate with related certificates to the position get medium score.
+Soft Skills Section: Prioritize foreign language and leadership skills. Candidate with more relevant soft skills get higher score.
+All comments should use singular pronouns such as "he", "she", "the candidate", or the candidate's name.
+"""
+
+# Errors worth retrying; anything else means Gemini answered and rejected the call
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+
+
+class GeminiUnavailableError(Exception):
+    """Raised when Gemini cannot be reached after retries or the circuit is open"""
+
+
+# Section weights of the overall matching score
+MATCHING_WEIGHTS = {
+    "degree": 0.1,
+    "experience": 0.2,
+    "technical_skill": 0.3,
+    "responsibility": 0.25,
+    "certificate": 0.1,
+    "soft_skill": 0.05,
+}
+
 class AIService:
     def __init__(self):
+        # The Gemini client is created on first use, keeping imports and startup fast
+        self._model = None
+        
+        # Global gate on in-flight Gemini calls, shared by every request
+        self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate=settings.GEMINI_RATE_LIMIT,
+            burst=settings.GEMINI_RATE_BURST,
+            min_rate=settings.GEMINI_MIN_RATE,
+            max_rate=settings.GEMINI_RATE_LIMIT
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.GEMINI_CIRCUIT_RESET_TIMEOUT
+        )
+        
+        self.cache = LLMCache()
+        
+        # Input/output token counts per operation
+        self.token_usage = {}
+        
+        # Read at scrape time, so they cost nothing per call
+        metrics.GEMINI_CIRCUIT_OPEN.set_function(lambda: float(self.circuit_breaker.state != CircuitBreaker.CLOSED))
+        metrics.GEMINI_RATE_LIMIT.set_function(lambda: self.rate_limiter.rate)
+
+    @property
+    def configured(self) -> bool:
+        """Whether calls can be made, either with an API key or the fake model"""
+        return settings.GEMINI_FAKE or bool(settings.GEMINI_API_KEY)
+
+    @property
+    def model(self):
+        """The Gemini model, created on first use"""
+        if self._model is None:
+            self._model = self._create_model()
+        return self._model
+
+    @staticmethod
+    def _create_model():
+        if settings.GEMINI_FAKE:
+            logger.warning("GEMINI_FAKE is enabled, AI responses are generated locally")
+            return FakeGeminiModel(
+                latency=settings.GEMINI_FAKE_LATENCY,
+                quota_per_second=settings.GEMINI_FAKE_QUOTA,
+                failure_rate=settings.GEMINI_FAKE_FAILURE_RATE
+            )
+        
         if not settings.GEMINI_API_KEY:
             logger.error("GEMINI_API_KEY not found in environment variables")
             raise ValueError("GEMINI_API_KEY is required")
         
+        # Imported here: the SDK takes most of a second to import
+        import google.generativeai as genai
+        
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        return genai.GenerativeModel(settings.GEMINI_MODEL)
+
+    async def _generate(self, prompt: str, operation: str) -> str:
+        """Call Gemini without blocking the event loop and return the raw text"""
+        # Covers semaphore, rate limiter and backoff waits as well as the calls
+        with tracing.span("gemini.generate", operation=operation):
+            return await self._generate_with_retries(prompt, operation)
+
+    async def _generate_with_retries(self, prompt: str, operation: str) -> str:
+        """Call Gemini through the breaker and rate limiter, retrying transient errors"""
+        model = self.model  # Raises before queueing if Gemini is not configured
+        prompt = prompt_builder.compact_prompt(prompt)
+        deadline = time.monotonic() + settings.GEMINI_RETRY_DEADLINE
+        attempt = 0
+        
+        async with self._semaphore:
+            while True:
+                try:
+                    self.circuit_breaker.before_call()
+                except CircuitOpenError as e:
+                    # Wait out a half-open probe rather than failing alongside it
+                    if self.circuit_breaker.state != CircuitBreaker.HALF_OPEN or time.monotonic() > deadline:
+                        metrics.GEMINI_ERRORS.labels(operation, "CircuitOpen").inc()
+                        raise GeminiUnavailableError(str(e))
+                    await self.circuit_breaker.wait_until_available()
+                    continue
+                
+                await self.rate_limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    with metrics.GEMINI_IN_FLIGHT.track_inprogress(), tracing.span("gemini.generate_content", attempt=attempt + 1):
+                        response = await asyncio.wait_for(
+                            model.generate_content_async(prompt),
+                            timeout=settings.GEMINI_TIMEOUT
+                        )
+                    response_text = response.text
+                except TRANSIENT_ERRORS as e:
+                    self._observe_call(operation, "transient_error", started)
+                    self.circuit_breaker.record_failure()
+                    if isinstance(e, google_exceptions.ResourceExhausted):
+                        self.rate_limiter.on_throttled()
+                    
+                    # Exponential backoff with full jitter, within the overall deadline
+                    attempt += 1
+                    delay = random.uniform(0, min(settings.GEMINI_BACKOFF_MAX, settings.GEMINI_BACKOFF_BASE * 2 ** attempt))
+                    if attempt > settings.GEMINI_MAX_RETRIES or time.monotonic() + delay > deadline:
+                        metrics.GEMINI_ERRORS.labels(operation, type(e).__name__).inc()
+                        raise GeminiUnavailableError(f"Gemini {operation} failed after {attempt} attempts: {str(e) or type(e).__name__}")
+                    
+                    metrics.GEMINI_RETRIES.labels(operation, type(e).__name__).inc()
+                    logger.warning(f"Transient Gemini error on {operation} (attempt {attempt}), retrying in {delay:.1f}s: {str(e) or type(e).__name__}")
+                    await asyncio.sleep(delay)
+                    continue
+                except asyncio.CancelledError:
+                    self.circuit_breaker.release_probe()
+                    raise
+                except Exception as e:
+                    # Not an outage, but not proof of recovery either (e.g. a revoked key):
+                    # free the probe without closing the breaker or resetting its failure count
+                    self._observe_call(operation, "error", started)
+                    metrics.GEMINI_ERRORS.labels(operation, type(e).__name__).inc()
+                    self.circuit_breaker.release_probe()
+                    raise
+                
+                self._observe_call(operation, "success", started)
+                self.circuit_breaker.record_success()
+                self.rate_limiter.on_success()
+                break
+        
+        self._record_usage(operation, prompt, response_text, getattr(response, "usage_metadata", None))
+        return response_text
+
+    @staticmethod
+    def _observe_call(operation: str, outcome: str, started: float):
+        """Record the latency of one Gemini attempt"""
+        metrics.GEMINI_REQUEST_DURATION.labels(operation, outcome).observe(time.perf_counter() - started)
 
-    async def analyze_candidate(self, cv_content: str) -> dict:
-        """Analyze candidate CV using Google Gemini"""
+    def _record_usage(self, operation: str, prompt: str, response_text: str, usage_metadata=None):
+        """Record token counts, preferring the API's figures over estimates"""
+        input_tokens = getattr(usage_metadata, "prompt_token_count", None) or prompt_builder.estimate_tokens(prompt)
+        output_tokens = getattr(usage_metadata, "candidates_token_count", None) or prompt_builder.estimate_tokens(response_text)
+        
+        usage = self.token_usage.setdefault(operation, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+        usage["calls"] += 1
+        usage["input_tokens"] += input_tokens
+        usage["output_tokens"] += output_tokens
+        tracing.set_attributes(**{"gemini.input_tokens": input_tokens, "gemini.output_tokens": output_tokens})
+        metrics.GEMINI_TOKENS.labels(operation, "input").inc(input_tokens)
+        metrics.GEMINI_TOKENS.labels(operation, "output").inc(output_tokens)
+        logger.debug(f"Gemini {operation}: {input_tokens} input tokens, {output_tokens} output tokens")
+
+    @staticmethod
+    def _parse_json_response(response_text: str) -> dict:
+        """Parse a JSON reply, tolerating markdown code fences"""
+        response_text = response_text.strip()
+        
+        # Remove markdown code blocks if present
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+        
+        return json.loads(response_text.strip())
+
+    def candidate_analysis_info(self) -> dict:
+        """Prompt and model a candidate analysis is made with, stored on each candidate"""
+        return {
+            "analysis_prompt_version": CANDIDATE_PROMPT_VERSION,
+            "analysis_model": settings.GEMINI_MODEL
+        }
+
+    async def analyze_candidate(self, cv_content: str, fallback: bool = True) -> dict:
+        """Analyze candidate CV using Google Gemini.
+
+        Errors other than Gemini being unavailable return a default response,
+        or are raised when fallback is False.
+        """
+        
+        cv_content = prompt_builder.fit_text(cv_content, settings.CANDIDATE_PROMPT_TOKEN_BUDGET)
+        cache_key = self.cache.make_key(settings.GEMINI_MODEL, CANDIDATE_PROMPT_VERSION, cv_content)
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         system_prompt = """
         Let's think step by step.
@@ -58,24 +278,29 @@ class AIService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response_text = await self._generate(prompt, "analyze_candidate")
+            result = self._parse_json_response(response_text)
             
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            return json.loads(response_text.strip())
+            await self.cache.set(cache_key, result)
+            return result
             
+        except GeminiUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error analyzing candidate with Gemini: {str(e)}")
+            if not fallback:
+                raise
             return self._get_default_candidate_response()
 
     async def analyze_job(self, job_description: str) -> dict:
         """Analyze job description using Google Gemini"""
         
+        job_description = prompt_builder.fit_text(job_description, settings.JOB_PROMPT_TOKEN_BUDGET)
+        cache_key = self.cache.make_key(settings.GEMINI_MODEL, JOB_PROMPT_VERSION, job_description)
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         system_prompt = """
         Let's think step by step.
         Respond using only the provided information and do not rely on your basic knowledge. The details given might be out of sequence or incomplete.
@@ -106,40 +331,79 @@ class AIService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response_text = await self._generate(prompt, "analyze_job")
+            result = self._parse_json_response(response_text)
             
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            return json.loads(response_text.strip())
+            await self.cache.set(cache_key, result)
+            return result
             
+        except GeminiUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error analyzing job with Gemini: {str(e)}")
             return self._get_default_job_response()
 
-    async def analyze_matching(self, candidate: dict, job: dict) -> dict:
-        """Analyze candidate-job matching using Google Gemini"""
+    def _matching_content(self, candidate: dict, job: dict) -> tuple[str, str]:
+        """Serialize the scoring sections of a pair and derive its cache key"""
         
-        system_prompt = """
-        Scoring Guide:
-        It's ok to say candidate does not match the requirement.
-        Degree Section: Prioritize major than degree level. Candidate with degrees more directly relevant to the required degree should receive higher score, even if their degree level is lower.
-        Experience Section: Candidate with more relevant experience field get higher score.
-        Technical Skills Section: Candidate with more relevant technical skills get higher score.
-        Responsibilities Section: Candidate with more relevant responsibilities get higher score.
-        Certificates Section: Candidate with required certificates get higher score. Candidate without required certificates get no score. Candidate with related certificates to the position get medium score.
-        Soft Skills Section: Prioritize foreign language and leadership skills. Candidate with more relevant soft skills get higher score.
-        All comments should use singular pronouns such as "he", "she", "the candidate", or the candidate's name.
+        # Only the scoring sections are sent, in compact canonical form
+        requirement, candidate_profile = prompt_builder.build_matching_content(
+            job, candidate, settings.MATCHING_PROMPT_TOKEN_BUDGET
+        )
+        content = f"Requirement: {requirement}\nCandidate: {candidate_profile}"
+        cache_key = self.cache.make_key(settings.GEMINI_MODEL, MATCHING_PROMPT_VERSION, content)
+        return content, cache_key
+
+    @staticmethod
+    def _weighted_score(result: dict) -> float:
+        """Calculate the overall score from the section scores"""
+        weighted_score = 0
+        for section, weight in MATCHING_WEIGHTS.items():
+            if section in result:
+                weighted_score += result[section]["score"] * weight
+        return weighted_score
+
+    @staticmethod
+    def _is_valid_matching(result) -> bool:
+        """Check that a matching result has every scored section"""
+        if not isinstance(result, dict) or not isinstance(result.get("summary_comment"), str):
+            return False
+        for section in MATCHING_WEIGHTS:
+            value = result.get(section)
+            if not isinstance(value, dict) or not isinstance(value.get("score"), (int, float)):
+                return False
+        return True
+
+    async def analyze_matching(self, candidate: dict, job: dict, fallback: bool = True) -> dict:
+        """Analyze candidate-job matching using Google Gemini.
+
+        Errors other than Gemini being unavailable, including replies missing
+        a section score, return a default response, or are raised when
+        fallback is False.
         """
         
-        content = f"\nRequirement: {str(job)}\nCandidate: {str(candidate)}"
+        content, cache_key = self._matching_content(candidate, job)
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
+        try:
+            result = await self._score_one(content)
+            await self.cache.set(cache_key, result)
+            return result
+            
+        except GeminiUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error analyzing matching with Gemini: {str(e)}")
+            if not fallback:
+                raise
+            return self._get_default_matching_response()
+
+    async def _score_one(self, content: str) -> dict:
+        """Score one candidate-job pair in its own call, raising on an unusable reply"""
         prompt = f"""
-        {system_prompt}
+        {MATCHING_SYSTEM_PROMPT}
         
         Please analyze the matching between candidate and job requirements:
         
@@ -159,39 +423,135 @@ class AIService:
         Respond only with valid JSON, no additional text.
         """
         
-        try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            result = json.loads(response_text.strip())
-            
-            # Calculate weighted score
-            weights = {
-                "degree": 0.1,
-                "experience": 0.2,
-                "technical_skill": 0.3,
-                "responsibility": 0.25,
-                "certificate": 0.1,
-                "soft_skill": 0.05,
-            }
-            
-            weighted_score = 0
-            for section, weight in weights.items():
-                if section in result:
-                    weighted_score += result[section]["score"] * weight
-            
-            result["score"] = weighted_score
-            return result
+        response_text = await self._generate(prompt, "analyze_matching")
+        result = self._parse_json_response(response_text)
+        if not self._is_valid_matching(result):
+            raise ValueError("Matching reply is missing section scores")
+        
+        # Calculate weighted score
+        result["score"] = self._weighted_score(result)
+        return result
+
+    async def analyze_matching_batch(self, candidates: list, job: dict, candidates_per_prompt: Optional[int] = None) -> dict:
+        """Score several candidates against one job in shared Gemini calls.
+
+        Candidates are sent candidates_per_prompt per call, all of them in one
+        call by default, and the cache is read and written once for the batch.
+        Returns results keyed by candidate ``_id``; a candidate maps to None
+        when Gemini could not be reached or gave no usable score for it.
+        """
+        results = {}
+        groups = {}
+        
+        keyed = [(candidate, *self._matching_content(candidate, job)) for candidate in candidates]
+        cached = await self.cache.get_many([cache_key for _, _, cache_key in keyed])
+        for candidate, content, cache_key in keyed:
+            candidate_id = str(candidate["_id"])
+            if cache_key in cached:
+                results[candidate_id] = cached[cache_key]
+                continue
             
+            # Candidates can only share a prompt when the requirement text is identical
+            requirement, candidate_profile = content.split("\nCandidate: ", 1)
+            groups.setdefault(requirement, []).append((candidate, candidate_id, candidate_profile, cache_key))
+        
+        size = candidates_per_prompt or len(candidates)
+        await asyncio.gather(*(
+            self._score_batch(requirement, entries[i:i + size], job, results)
+            for requirement, entries in groups.items()
+            for i in range(0, len(entries), size)
+        ))
+        
+        await self.cache.set_many({
+            cache_key: results[candidate_id]
+            for entries in groups.values()
+            for _, candidate_id, _, cache_key in entries
+            if results.get(candidate_id) is not None
+        })
+        return results
+
+    async def _score_batch(self, requirement: str, entries: list, job: dict, results: dict):
+        """Score one group in a single call, splitting it when the reply is unusable"""
+        if len(entries) == 1:
+            _, candidate_id, candidate_profile, _ = entries[0]
+            try:
+                results[candidate_id] = await self._score_one(f"{requirement}\nCandidate: {candidate_profile}")
+            except Exception as e:
+                logger.error(f"Error analyzing matching with Gemini: {str(e)}")
+                results[candidate_id] = None
+            return
+        
+        candidates_block = "\n".join(
+            f"Candidate {candidate_id}: {candidate_profile}"
+            for _, candidate_id, candidate_profile, _ in entries
+        )
+        prompt = f"""
+        {MATCHING_SYSTEM_PROMPT}
+        
+        Please analyze the matching between each candidate and the job requirements:
+        
+        {requirement}
+        {candidates_block}
+        
+        Return a JSON array with one object per candidate, with detailed scoring and comments for each category:
+        [
+            {{
+                "candidate_id": "id of the candidate",
+                "degree": {{"score": 0-100, "comment": "explanation"}},
+                "experience": {{"score": 0-100, "comment": "explanation"}},
+                "technical_skill": {{"score": 0-100, "comment": "explanation"}},
+                "responsibility": {{"score": 0-100, "comment": "explanation"}},
+                "certificate": {{"score": 0-100, "comment": "explanation"}},
+                "soft_skill": {{"score": 0-100, "comment": "explanation"}},
+                "summary_comment": "overall assessment"
+            }}
+        ]
+        
+        Respond only with valid JSON, no additional text.
+        """
+        
+        try:
+            response_text = await self._generate(prompt, "analyze_matching_batch")
         except Exception as e:
-            logger.error(f"Error analyzing matching with Gemini: {str(e)}")
-            return self._get_default_matching_response()
+            logger.error(f"Error analyzing matching batch with Gemini: {str(e)}")
+            for _, candidate_id, _, _ in entries:
+                results[candidate_id] = None
+            return
+        
+        try:
+            parsed = self._parse_json_response(response_text)
+            by_id = {
+                str(item.get("candidate_id")): item
+                for item in parsed if isinstance(item, dict)
+            } if isinstance(parsed, list) else {}
+        except ValueError:
+            by_id = {}
+        
+        missing = []
+        for entry in entries:
+            _, candidate_id, _, cache_key = entry
+            result = by_id.get(candidate_id)
+            if not self._is_valid_matching(result):
+                missing.append(entry)
+                continue
+            
+            result.pop("candidate_id", None)
+            result["score"] = self._weighted_score(result)
+            results[candidate_id] = result
+        
+        if not missing:
+            return
+        
+        # Malformed or truncated reply: retry what is left in smaller batches
+        logger.warning(f"Matching batch reply unusable for {len(missing)} of {len(entries)} candidates, splitting")
+        if len(missing) < len(entries):
+            await self._score_batch(requirement, missing, job, results)
+        else:
+            middle = len(missing) // 2
+            await asyncio.gather(
+                self._score_batch(requirement, missing[:middle], job, results),
+                self._score_batch(requirement, missing[middle:], job, results)
+            )
 
     def _get_default_candidate_response(self):
         """Return default response when Gemini fails"""
@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import logging
+import os
+import secrets
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core import tracing
+from app.services.ai_service import ai_service
+
+logger = logging.getLogger(__name__)
+
+RUN_PENDING = "pending"
+RUN_RUNNING = "running"
+RUN_COMPLETED = "completed"
+RUN_PAUSED = "paused"
+RUN_FAILED = "failed"
+ACTIVE_RUN_STATUSES = [RUN_PENDING, RUN_RUNNING, RUN_PAUSED]
+
+
+class RunLeaseLost(Exception):
+    """Raised when another worker took a run over"""
+
+
+class BackgroundRuns:
+    """Lifecycle of resumable runs over the candidates collection.
+
+    A run document lives in ``collection`` and walks candidates in ``_id``
+    order, checkpointing its counters and the last candidate after each batch,
+    so an interrupted run resumes where it stopped. Subclasses choose the
+    candidates in ``_prepare`` and handle one batch in ``_process_batch``.
+
+    Every worker process can start and resume runs, so a run is executed only
+    by the worker holding its lease: ``owner`` and ``lease_until`` are claimed
+    atomically and renewed while the run executes. A run whose lease expired,
+    e.g. because its worker died, is taken over by the next ``resume_runs``.
+    """
+
+    collection: str
+    label: str  # Capitalized name used in logs
+    trace_name: str  # Prefix of the per-batch trace
+    counters = ("processed", "skipped", "failed")
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.lease_seconds = settings.RUN_LEASE_SECONDS
+        # Unique per instance, so runs are never shared even within one process
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        # Keep references to background runs so they are not garbage collected
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def _runs(self, db):
+        return db[self.collection]
+
+    def _claimable(self) -> dict:
+        """Runs nobody holds a live lease on, or held by this instance"""
+        return {"$or": [
+            {"owner": None},
+            {"owner": self.owner},
+            {"lease_until": {"$lt": datetime.utcnow()}}
+        ]}
+
+    async def _active_run(self, db, query: dict) -> Optional[dict]:
+        """The run in progress matching the query, launched here unless a worker executes it"""
+        active_run = await self._runs(db).find_one({**query, "status": {"$in": ACTIVE_RUN_STATUSES}})
+        if active_run and str(active_run["_id"]) not in self._tasks:
+            self._launch(db, active_run["_id"])
+        return active_run
+
+    async def _create_run(self, db, fields: dict) -> dict:
+        """Insert a run with zeroed counters and execute it in the background"""
+        now = datetime.utcnow()
+        run_doc = {
+            **fields,
+            "status": RUN_PENDING,
+            **{counter: 0 for counter in self.counters},
+            "last_candidate_id": None,
+            "owner": None,
+            "lease_until": None,
+            "throughput": 0.0,
+            "eta_seconds": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None
+        }
+        result = await self._runs(db).insert_one(run_doc)
+        run_doc["_id"] = result.inserted_id
+
+        self._launch(db, run_doc["_id"])
+        return run_doc
+
+    async def resume_runs(self, db) -> int:
+        """Launch active runs whose worker stopped, e.g. after a restart or a crash"""
+        cursor = self._runs(db).find({"status": {"$in": ACTIVE_RUN_STATUSES}, **self._claimable()}, {"_id": 1})
+        resumed = 0
+        async for run in cursor:
+            if str(run["_id"]) not in self._tasks:
+                self._launch(db, run["_id"])
+                resumed += 1
+
+        if resumed:
+            logger.info(f"Resuming {resumed} interrupted {self.label.lower()} run(s)")
+        return resumed
+
+    async def supervise(self, db):
+        """Resume abandoned runs now and then every lease period, for as long as the worker lives"""
+        while True:
+            try:
+                await self.resume_runs(db)
+            except Exception as e:
+                logger.error(f"Resuming {self.label.lower()} runs failed: {str(e)}")
+            await asyncio.sleep(self.lease_seconds)
+
+    async def shutdown(self):
+        """Stop the runs executed here, releasing their leases for another worker"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_run(self, db, run_id: str) -> Optional[dict]:
+        """Get a run by ID"""
+        return await self._runs(db).find_one({"_id": ObjectId(run_id)})
+
+    def _launch(self, db, run_id: ObjectId):
+        """Schedule a run on the event loop"""
+        key = str(run_id)
+        task = asyncio.create_task(self._execute_run(db, run_id))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _prepare(self, db, run: dict) -> tuple[dict, dict, dict]:
+        """Return the candidate query, projection and batch context of a run"""
+        raise NotImplementedError
+
+    async def _process_batch(self, db, run: dict, candidates: list, context: dict) -> dict:
+        """Handle one batch, returning how many candidates went to each counter"""
+        raise NotImplementedError
+
+    async def _claim(self, db, run_id: ObjectId) -> Optional[dict]:
+        """Take the lease of an active run, None if another worker holds it"""
+        now = datetime.utcnow()
+        return await self._runs(db).find_one_and_update(
+            {"_id": run_id, "status": {"$in": ACTIVE_RUN_STATUSES}, **self._claimable()},
+            {"$set": {
+                "owner": self.owner,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "status": RUN_RUNNING,
+                "updated_at": now
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _heartbeat(self, db, run_id: ObjectId, run_task: asyncio.Task):
+        """Renew the lease while the run executes, including while it is paused"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await self._runs(db).update_one(
+                    {"_id": run_id, "owner": self.owner},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                logger.warning(f"Renewing the lease of {self.label.lower()} run {run_id} failed: {str(e)}")
+                continue
+            if not result.matched_count:
+                logger.warning(f"{self.label} run {run_id} was taken over by another worker, stopping")
+                run_task.cancel()
+                return
+
+    async def _release(self, db, run_id: ObjectId):
+        """Give the lease up so another worker resumes the run without waiting for it to expire"""
+        await self._runs(db).update_one(
+            {"_id": run_id, "owner": self.owner},
+            {"$set": {"owner": None, "lease_until": None, "updated_at": datetime.utcnow()}}
+        )
+
+    async def _execute_run(self, db, run_id: ObjectId):
+        """Walk the run's candidates, checkpointing after each batch"""
+        # Each batch is traced on its own rather than under the request that started the run
+        tracing.detach()
+        heartbeat = None
+        try:
+            run = await self._claim(db, run_id)
+            if run is None:
+                return
+            heartbeat = asyncio.create_task(self._heartbeat(db, run_id, asyncio.current_task()))
+
+            query, projection, context = await self._prepare(db, run)
+
+            # Resume after the last checkpointed candidate
+            if run.get("last_candidate_id"):
+                query["_id"] = {"$gt": run["last_candidate_id"]}
+
+            progress = {
+                "done": sum(run.get(counter, 0) for counter in self.counters),
+                "session_done": 0,
+                "started": time.monotonic()
+            }
+
+            # Walk candidates in _id order so the checkpoint is a single key
+            cursor = db.candidates.find(query, projection).sort("_id", 1).batch_size(self.batch_size)
+            batch = []
+            async for candidate in cursor:
+                batch.append(candidate)
+                if len(batch) < self.batch_size:
+                    continue
+                await self._run_batch(db, run, batch, context, progress)
+                batch = []
+
+            if batch:
+                await self._run_batch(db, run, batch, context, progress)
+
+            await self._update_run(db, run_id, {
+                "status": RUN_COMPLETED,
+                "eta_seconds": 0,
+                "finished_at": datetime.utcnow()
+            })
+
+        except asyncio.CancelledError:
+            # Leave the run active for another worker or the next startup
+            with contextlib.suppress(Exception):
+                await self._release(db, run_id)
+            raise
+        except RunLeaseLost:
+            logger.warning(f"{self.label} run {run_id} was taken over by another worker, stopping")
+        except Exception as e:
+            logger.error(f"{self.label} run {run_id} failed: {str(e)}")
+            with contextlib.suppress(RunLeaseLost):
+                await self._update_run(db, run_id, {
+                    "status": RUN_FAILED,
+                    "error": str(e),
+                    "finished_at": datetime.utcnow()
+                })
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+
+    async def _run_batch(self, db, run: dict, batch: list, context: dict, progress: dict):
+        """Process one traced batch and checkpoint it"""
+        with tracing.start_trace(f"{self.trace_name}.batch", run_id=str(run["_id"]), candidates=len(batch)):
+            counts = await self._process_batch(db, run, batch, context)
+        progress["done"] += sum(counts.values())
+        progress["session_done"] += sum(counts.values())
+        await self._checkpoint(db, run, batch[-1]["_id"], counts, progress)
+
+    async def _checkpoint(self, db, run: dict, last_candidate_id, counts: dict, progress: dict):
+        """Persist progress, throughput and ETA after a batch"""
+        done = progress["done"]
+        elapsed = time.monotonic() - progress["started"]
+        throughput = progress["session_done"] / elapsed if elapsed > 0 else 0.0
+
+        # Candidates added during the run extend the total
+        total = max(run["total"], done)
+        remaining = total - done
+        run["total"] = total
+
+        now = datetime.utcnow()
+        result = await self._runs(db).update_one(
+            {"_id": run["_id"], "owner": self.owner},
+            {
+                "$inc": counts,
+                "$set": {
+                    "last_candidate_id": last_candidate_id,
+                    "total": total,
+                    "throughput": round(throughput, 2),
+                    "eta_seconds": round(remaining / throughput, 1) if throughput > 0 else None,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                }
+            }
+        )
+        if not result.matched_count:
+            raise RunLeaseLost()
+
+    async def _update_run(self, db, run_id: ObjectId, fields: dict):
+        """Set fields on a run this instance holds the lease of"""
+        result = await self._runs(db).update_one(
+            {"_id": run_id, "owner": self.owner},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}}
+        )
+        if not result.matched_count:
+            raise RunLeaseLost()
+
+    async def _pause_run(self, db, run_id: ObjectId):
+        """Mark a run paused until the Gemini circuit breaker lets calls through again"""
+        logger.warning(f"{self.label} run {run_id} paused, Gemini is unavailable")
+        await self._update_run(db, run_id, {"status": RUN_PAUSED})
+        await ai_service.circuit_breaker.wait_until_available()
+        await self._update_run(db, run_id, {"status": RUN_RUNNING})
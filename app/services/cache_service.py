@@ -0,0 +1,124 @@
+import copy
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core import metrics
+from app.core.database import get_database
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """Content-addressed cache for LLM responses.
+
+    An in-process LRU sits in front of the ``llm_cache`` collection, whose
+    entries expire through a TTL index on ``created_at``.
+    """
+
+    def __init__(self, max_size: int = None, enabled: bool = None):
+        self.max_size = max_size if max_size is not None else settings.LLM_CACHE_SIZE
+        self.enabled = enabled if enabled is not None else settings.LLM_CACHE_ENABLED
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        metrics.LLM_CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    @staticmethod
+    def make_key(model_name: str, prompt_version: str, payload) -> str:
+        """Hash the model, prompt version and normalized input into a cache key"""
+        if isinstance(payload, str):
+            normalized = " ".join(payload.split())
+        else:
+            normalized = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_version, normalized):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return a cached response, checking memory first and then MongoDB"""
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys: list) -> dict:
+        """Return cached responses by key, with one MongoDB query for the keys not in memory"""
+        found = {}
+        if not self.enabled:
+            return found
+
+        missing = []
+        for key in dict.fromkeys(keys):
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                metrics.LLM_CACHE_LOOKUPS.labels("memory_hit").inc()
+                found[key] = copy.deepcopy(self._entries[key])
+            else:
+                missing.append(key)
+
+        db = await get_database() if missing else None
+        if db is not None:
+            try:
+                async for doc in db.llm_cache.find({"_id": {"$in": missing}}, {"value": 1}):
+                    self._remember(doc["_id"], doc["value"])
+                    self.store_hits += 1
+                    metrics.LLM_CACHE_LOOKUPS.labels("store_hit").inc()
+                    found[doc["_id"]] = copy.deepcopy(doc["value"])
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {str(e)}")
+
+        misses = sum(1 for key in missing if key not in found)
+        self.misses += misses
+        metrics.LLM_CACHE_LOOKUPS.labels("miss").inc(misses)
+        return found
+
+    async def set(self, key: str, value: dict):
+        """Store a response in both tiers"""
+        await self.set_many({key: value})
+
+    async def set_many(self, values: dict):
+        """Store responses by key in both tiers, with one MongoDB write"""
+        if not self.enabled or not values:
+            return
+
+        for key, value in values.items():
+            self._remember(key, copy.deepcopy(value))
+
+        db = await get_database()
+        if db is not None:
+            now = datetime.utcnow()
+            try:
+                await db.llm_cache.bulk_write([
+                    UpdateOne({"_id": key}, {"$set": {"value": value, "created_at": now}}, upsert=True)
+                    for key, value in values.items()
+                ], ordered=False)
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {str(e)}")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters"""
+        lookups = self.memory_hits + self.store_hits + self.misses
+        hits = self.memory_hits + self.store_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size
+        }
+
+    def _remember(self, key: str, value: dict):
+        """Insert into the LRU, evicting the least recently used entry"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -1,63 +1,204 @@
 import os
+import asyncio
+import contextlib
 import hashlib
+import multiprocessing
+import re
+import tempfile
+import time
 import aiofiles
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from typing import Optional
 from fastapi import UploadFile
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader
 from app.core.config import settings
+from app.core import metrics, tracing
+from app.services import text_extractor
+from app.services.text_extractor import ExtractedText
 import logging
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Saved uploads are named "<timestamp>-<original filename>", see commit_uploaded_file
+SAVED_FILENAME_RE = re.compile(r"^\d{14}-(.+)$")
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds MAX_FILE_SIZE"""
+
+
+class ExtractionTimeoutError(ValueError):
+    """Raised when text extraction exceeds EXTRACTION_TIMEOUT"""
+
+
+def _extract_text_in_worker(filename: str) -> ExtractedText:
+    """Entry point for extraction inside a pool process"""
+    return document_service.extract_text_from_file(filename)
+
 
 class DocumentService:
     def __init__(self):
         self.upload_dir = settings.UPLOAD_DIR
         os.makedirs(self.upload_dir, exist_ok=True)
+        
+        # Created on first use so importing the service stays cheap
+        self._pool: Optional[ProcessPoolExecutor] = None
 
-    async def save_uploaded_file(self, file: UploadFile) -> tuple[str, str]:
-        """Save uploaded file and return filename and hash"""
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Return the extraction process pool, creating it if needed"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.EXTRACTION_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _recycle_pool(self, pool: ProcessPoolExecutor):
+        """Kill a pool whose worker is stuck so the next call gets fresh processes"""
+        if self._pool is pool:
+            self._pool = None
         
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{timestamp}-{file.filename}"
-        file_path = os.path.join(self.upload_dir, filename)
+        # A hung parser cannot be interrupted, only terminated with its process
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def extract_text(self, filename: str) -> ExtractedText:
+        """Extract text and page count in the process pool, recording its time and the file size"""
+        file_type = os.path.splitext(filename)[1].lower().lstrip(".") or "unknown"
+        with contextlib.suppress(OSError):
+            metrics.EXTRACTION_BYTES.labels(file_type).observe(os.path.getsize(os.path.join(self.upload_dir, filename)))
         
-        # Read file content
-        content = await file.read()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with metrics.EXTRACTIONS_IN_FLIGHT.track_inprogress(), tracing.span("document.extract_text", file_type=file_type) as span:
+                extracted = await self._extract_text_in_pool(filename)
+                if span is not None:
+                    span.set_attribute("document.chars", len(extracted.text))
+            outcome = "success" if extracted.text else "empty"
+            return extracted
+        except ExtractionTimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            metrics.EXTRACTION_DURATION.labels(file_type, outcome).observe(time.perf_counter() - started)
+
+    async def _extract_text_in_pool(self, filename: str) -> ExtractedText:
+        """Extract text in the process pool, bounded by EXTRACTION_TIMEOUT"""
+        loop = asyncio.get_running_loop()
         
-        # Calculate file hash
-        file_hash = hashlib.sha256(content).hexdigest()
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(pool, _extract_text_in_worker, filename),
+                    timeout=settings.EXTRACTION_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"Text extraction timed out for {filename}")
+                self._recycle_pool(pool)
+                raise ExtractionTimeoutError(
+                    f"Text extraction timed out after {settings.EXTRACTION_TIMEOUT:g}s"
+                )
+            except BrokenProcessPool:
+                # Another file's timeout recycled the pool under us; retry once
+                if attempt:
+                    raise
+                if self._pool is pool:
+                    self._pool = None
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
+        return ExtractedText("", None)
+
+    def shutdown(self):
+        """Stop the extraction process pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def save_uploaded_file(self, file: UploadFile) -> tuple[str, str]:
+        """Stream an upload to a temporary file and return its path and hash"""
+        with tracing.span("document.save_upload", filename=file.filename) as span:
+            # Write under a temporary name until the caller decides to keep the file
+            fd, temp_path = tempfile.mkstemp(dir=self.upload_dir, suffix=".part")
+            os.close(fd)
+            
+            file_hash = hashlib.sha256()
+            size = 0
+            try:
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    while True:
+                        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        
+                        # Enforce the size limit before writing more to disk
+                        size += len(chunk)
+                        if size > settings.MAX_FILE_SIZE:
+                            raise FileTooLargeError(
+                                f"File exceeds the maximum size of {settings.MAX_FILE_SIZE // (1024 * 1024)}MB"
+                            )
+                        
+                        file_hash.update(chunk)
+                        await f.write(chunk)
+            except BaseException:
+                self.discard_temp_file(temp_path)
+                raise
+            
+            if span is not None:
+                span.set_attribute("document.bytes", size)
+            return temp_path, file_hash.hexdigest()
+
+    def commit_uploaded_file(self, temp_path: str, original_filename: str) -> str:
+        """Move a temporary upload to its final name and return that filename"""
         
-        return filename, file_hash
+        # Generate filename with timestamp
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        filename = f"{timestamp}-{os.path.basename(original_filename)}"
+        os.replace(temp_path, os.path.join(self.upload_dir, filename))
+        
+        return filename
 
-    def extract_text_from_file(self, filename: str) -> str:
+    def discard_temp_file(self, temp_path: str):
+        """Remove a temporary upload that will not be kept"""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+
+    def extract_text_from_file(self, filename: str) -> ExtractedText:
         """Extract text content from PDF or DOCX file"""
         file_path = os.path.join(self.upload_dir, filename)
         
         try:
-            if filename.lower().endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-            elif filename.lower().endswith('.docx'):
-                loader = Docx2txtLoader(file_path)
-            else:
-                raise ValueError(f"Unsupported file type: {filename}")
-            
-            documents = loader.load_and_split()
-            content = ""
-            for page in documents:
-                content += page.page_content
-            
-            return content
+            # CVs rarely say anything useful after the first pages
+            return text_extractor.extract_text(
+                file_path,
+                max_pages=settings.EXTRACTION_MAX_PAGES,
+                max_chars=settings.EXTRACTION_MAX_CHARS
+            )
             
         except Exception as e:
             logger.error(f"Error extracting text from {filename}: {str(e)}")
-            return ""
+            return ExtractedText("", None)
+
+    def upload_index(self) -> dict[str, list[str]]:
+        """Map original filenames to the saved uploads carrying them, newest first"""
+        index = {}
+        for name in sorted(os.listdir(self.upload_dir), reverse=True):
+            match = SAVED_FILENAME_RE.match(name)
+            if match:
+                index.setdefault(match.group(1), []).append(name)
+        return index
+
+    def file_hash(self, filename: str) -> str:
+        """SHA-256 of a saved upload, as stored in a candidate's filehash"""
+        file_hash = hashlib.sha256()
+        with open(os.path.join(self.upload_dir, filename), 'rb') as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
 
     def is_allowed_file(self, filename: str) -> bool:
         """Check if file type is allowed"""
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import deque
+from google.api_core import exceptions as google_exceptions
+from app.services.prompt_builder import MATCHING_SECTIONS
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Offline stand-in for ``genai.GenerativeModel``.
+
+    Answers every prompt the AIService sends with deterministic JSON and can
+    simulate latency, a per-second quota (429) and random 503s, so throttling,
+    retries and the circuit breaker can be exercised without the network.
+    """
+
+    def __init__(self, latency: float = 0.05, quota_per_second: float = 0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.quota_per_second = quota_per_second
+        self.failure_rate = failure_rate
+        self.model_name = "fake-gemini"
+        self.calls = 0
+        self.throttled = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+        self._recent_calls = deque()
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        """Simulate a Gemini round-trip"""
+        self.calls += 1
+
+        if self.quota_per_second:
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] > 1:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self.quota_per_second:
+                self.throttled += 1
+                raise google_exceptions.ResourceExhausted("Quota exceeded (fake)")
+            self._recent_calls.append(now)
+
+        await asyncio.sleep(self.latency)
+
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failed += 1
+            raise google_exceptions.ServiceUnavailable("Service unavailable (fake)")
+
+        return FakeResponse(json.dumps(self._answer(prompt)))
+
+    def _answer(self, prompt: str):
+        """Build a plausible reply for whichever AIService prompt this is"""
+        batch_ids = re.findall(r"^Candidate ([0-9a-f]{24}):", prompt, re.MULTILINE)
+        if batch_ids:
+            return [{"candidate_id": candidate_id, **self._matching(prompt + candidate_id)} for candidate_id in batch_ids]
+        if "Candidate:" in prompt and "Requirement:" in prompt:
+            return self._matching(prompt)
+        if "CV Content:" in prompt:
+            return self._candidate(prompt)
+        return {section: [f"requirement {self._score(prompt + section) % 7}"] for section in MATCHING_SECTIONS}
+
+    def _matching(self, seed: str) -> dict:
+        result = {
+            section: {"score": self._score(seed + section), "comment": f"Fake assessment of {section}"}
+            for section in MATCHING_SECTIONS
+        }
+        result["summary_comment"] = "Fake overall assessment"
+        return result
+
+    def _candidate(self, prompt: str) -> dict:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return {
+            "candidate_name": f"Candidate {digest[:6]}",
+            "phone_number": "",
+            "email": f"{digest[:8]}@example.com",
+            "degree": ["Bachelor of Computer Science"],
+            "experience": [f"{self._score(digest) % 10} years software engineering"],
+            "technical_skill": ["python", "docker", "kubernetes"][: 1 + self._score(digest) % 3],
+            "responsibility": ["Build backend services"],
+            "certificate": [],
+            "soft_skill": ["English"],
+            "comment": "Generated by the fake Gemini model",
+            "job_recommended": ["Backend Engineer"],
+            "office": 0,
+            "sql": 0
+        }
+
+    @staticmethod
+    def _score(seed: str) -> int:
+        return int(hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8], 16) % 101
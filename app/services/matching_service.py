@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.core import metrics
+from app.services.ai_service import ai_service, MATCHING_WEIGHTS
+from app.services.background_runs import BackgroundRuns
+from app.services.prompt_builder import MATCHING_SECTIONS, analysis_version
+from app.services.rate_limiter import CircuitBreaker
+from app.services.vector_index import vector_index, vectorize
+
+logger = logging.getLogger(__name__)
+
+PREFILTERED_COMMENT = "Not sent to Gemini: local similarity to the job below the run's threshold"
+
+# Candidate fields the matcher needs; the rest is never sent to the LLM
+CANDIDATE_MATCHING_PROJECTION = {"candidate_name": 1, "analysis_version": 1, **{section: 1 for section in MATCHING_SECTIONS}}
+
+
+class MatchingService(BackgroundRuns):
+    """Scores candidates against a job in resumable runs stored in ``matching_runs``"""
+
+    collection = "matching_runs"
+    label = "Matching"
+    trace_name = "matching"
+    counters = ("processed", "skipped", "failed", "prefiltered")
+
+    def __init__(self):
+        super().__init__(settings.MATCHING_BATCH_SIZE)
+        metrics.MATCHING_RUNS_ACTIVE.set_function(lambda: len(self._tasks))
+
+    async def start_run(
+        self,
+        db,
+        job: dict,
+        candidates_per_prompt: Optional[int] = None,
+        shortlist_k: Optional[int] = None,
+        min_prefilter_score: Optional[float] = None
+    ) -> dict:
+        """Create a matching run for a job and execute it in the background.
+
+        With shortlist_k or min_prefilter_score, only the candidates most
+        similar to the job by local vectors are sent to Gemini.
+        """
+
+        # Reuse the run already in progress for this job, if any
+        active_run = await self._active_run(db, {"job_id": job["_id"]})
+        if active_run:
+            return active_run
+
+        prefilter_threshold = None
+        if shortlist_k is not None or min_prefilter_score is not None:
+            prefilter_threshold = await self.prefilter_threshold(job, shortlist_k, min_prefilter_score)
+
+        return await self._create_run(db, {
+            "job_id": job["_id"],
+            "job_name": job["job_name"],
+            "candidates_per_prompt": candidates_per_prompt or settings.MATCHING_CANDIDATES_PER_PROMPT,
+            "shortlist_k": shortlist_k,
+            "min_prefilter_score": min_prefilter_score,
+            "prefilter_threshold": prefilter_threshold,
+            "total": await db.candidates.count_documents({})
+        })
+
+    async def prefilter_threshold(self, job: dict, k: Optional[int] = None, min_score: Optional[float] = None) -> Optional[float]:
+        """Similarity to a job's requirements a candidate needs to be sent to Gemini.
+
+        The similarity of the k-th closest candidate in the vector index, and
+        at least min_score. Runs compare every candidate they walk against it,
+        so candidates missing from the index are still ranked; candidates tied
+        with the k-th all qualify. None when every candidate qualifies.
+        """
+        thresholds = [min_score] if min_score is not None else []
+        if k is not None:
+            if not await asyncio.to_thread(vector_index.size):
+                raise ValueError("Candidate similarity index is empty; rebuild it with python -m app.migrate --rebuild-vectors")
+            hits = await vector_index.search(job, k)
+            # Fewer indexed candidates than k: the index cannot tell who ranks below the top k
+            if len(hits) == k:
+                thresholds.append(round(hits[-1][1], 4))
+        return max(thresholds) if thresholds else None
+
+    async def _prepare(self, db, run: dict) -> tuple[dict, dict, dict]:
+        """Every candidate is walked; the job is loaded once per run"""
+        job = await db.jobs.find_one({"_id": run["job_id"]})
+        if not job:
+            raise ValueError("Job no longer exists")
+
+        job_data = {**job}
+        job_data["_id"] = str(job_data["_id"])
+
+        return {}, CANDIDATE_MATCHING_PROJECTION, {
+            "job": job,
+            "job_data": job_data,
+            "candidates_per_prompt": run.get("candidates_per_prompt") or 1,
+            "prefilter_threshold": run.get("prefilter_threshold"),
+            "job_vector": vectorize(job, vector_index.dim)
+        }
+
+    async def _process_batch(self, db, run: dict, candidates: list, context: dict) -> dict:
+        """Match one batch of candidates: one lookup, concurrent scoring, one bulk write"""
+        started = time.monotonic()
+        job, job_data = context["job"], context["job_data"]
+        candidates_per_prompt = context["candidates_per_prompt"]
+        threshold = context["prefilter_threshold"]
+
+        # Prefetch existing records; only pairs scored from the current analyses are kept
+        job_version = self._version(job)
+        existing = await self._existing_versions(db, job["_id"], [c["_id"] for c in candidates])
+
+        # Candidates below the threshold never reach Gemini; a score they already have is kept
+        prefiltered = []
+        if threshold is not None:
+            similarities = await asyncio.to_thread(self._similarities, context["job_vector"], candidates)
+            prefiltered = [(c, similarity) for c, similarity in zip(candidates, similarities) if similarity < threshold]
+            candidates = [c for c, similarity in zip(candidates, similarities) if similarity >= threshold]
+        prefiltered_docs = self._prefiltered_docs(job, [(c, similarity) for c, similarity in prefiltered if c["_id"] not in existing])
+
+        pending = [
+            c for c in candidates
+            if existing.get(c["_id"]) != (job_version, self._version(c))
+        ]
+        skipped_count = len(candidates) - len(pending)
+
+        matching_docs = []
+        failed = []
+        while pending:
+            outages = ai_service.circuit_breaker.open_count
+
+            # Fan the LLM calls out; AIService bounds how many run at once
+            if candidates_per_prompt > 1:
+                matching_results = await self._analyze_in_prompts(pending, job_data, candidates_per_prompt)
+            else:
+                matching_results = await asyncio.gather(
+                    *(self._analyze(candidate, job_data) for candidate in pending)
+                )
+
+            failed = []
+            for candidate, matching_result in zip(pending, matching_results):
+                if matching_result is None:
+                    failed.append(candidate)
+                else:
+                    matching_doc = self._build_matching_doc(candidate["_id"], job["_id"], matching_result)
+                    matching_doc["job_version"] = job_version
+                    matching_doc["candidate_version"] = self._version(candidate)
+                    matching_docs.append(matching_doc)
+
+            # If Gemini went down meanwhile, pause the run instead of recording failures
+            breaker = ai_service.circuit_breaker
+            if not failed or (breaker.state != CircuitBreaker.OPEN and breaker.open_count == outages):
+                break
+            await self._pause_run(db, run["_id"])
+            pending = failed
+
+        # Weights can be edited while Gemini is scoring, so read them only now
+        weights = await self._current_weights(db, job["_id"])
+        for matching_doc in matching_docs:
+            matching_doc["score"] = self.weighted_score(matching_doc, weights)
+
+        # Save to database in one round-trip; only stale records need a lookup to replace
+        if matching_docs or prefiltered_docs:
+            try:
+                await db.matching.bulk_write([
+                    ReplaceOne({"candidate_id": doc["candidate_id"], "job_id": doc["job_id"]}, doc, upsert=True)
+                    if doc["candidate_id"] in existing else InsertOne(doc)
+                    for doc in matching_docs + prefiltered_docs
+                ], ordered=False)
+            except BulkWriteError as e:
+                # Pairs written by a worker whose lease this run took over are kept and count as skipped
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+                rejected = {error["index"] for error in e.details["writeErrors"] if error["index"] < len(matching_docs)}
+                matching_docs = [doc for i, doc in enumerate(matching_docs) if i not in rejected]
+                skipped_count += len(rejected)
+
+        # set_weights may have rescored the job just before this write landed
+        if matching_docs:
+            latest_weights = await self._current_weights(db, job["_id"])
+            if latest_weights != weights:
+                await self._rescore(db, job["_id"], latest_weights, [doc["candidate_id"] for doc in matching_docs])
+
+        metrics.MATCHING_BATCH_DURATION.observe(time.monotonic() - started)
+        metrics.MATCHING_PAIRS.labels("scored").inc(len(matching_docs))
+        metrics.MATCHING_PAIRS.labels("skipped").inc(skipped_count)
+        metrics.MATCHING_PAIRS.labels("failed").inc(len(failed))
+        metrics.MATCHING_PAIRS.labels("prefiltered").inc(len(prefiltered))
+        return {
+            "processed": len(matching_docs),
+            "skipped": skipped_count,
+            "failed": len(failed),
+            "prefiltered": len(prefiltered)
+        }
+
+    def _similarities(self, job_vector, candidates: list) -> list:
+        """Cosine similarity of each candidate profile to the job, rounded like the threshold"""
+        return [round(float(vectorize(candidate, vector_index.dim) @ job_vector), 4) for candidate in candidates]
+
+    def _prefiltered_docs(self, job: dict, candidates: list) -> list:
+        """Records for (candidate, similarity) pairs below the threshold, with their similarity"""
+        now = datetime.utcnow()
+        return [
+            {
+                "candidate_id": candidate["_id"],
+                "job_id": job["_id"],
+                "prefiltered": True,
+                "prefilter_score": similarity,
+                "summary_comment": PREFILTERED_COMMENT,
+                # No section scores: sorts after every scored record and is rescored once shortlisted
+                "score": None,
+                "created_at": now
+            }
+            for candidate, similarity in candidates
+        ]
+
+    def normalize_weights(self, weights: dict) -> dict:
+        """Scale section weights to sum to 1 so scores stay on the 0-100 scale"""
+        unknown = set(weights) - set(MATCHING_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+
+        total = sum(weights.values())
+        if total <= 0:
+            raise ValueError("At least one weight must be positive")
+        return {section: weights.get(section, 0) / total for section in MATCHING_WEIGHTS}
+
+    def job_weights(self, job: dict) -> dict:
+        """Weights configured on a job, falling back to the defaults"""
+        return job.get("weights") or MATCHING_WEIGHTS
+
+    def weighted_score(self, matching_result: dict, weights: dict) -> float:
+        """Combine section scores with the given weights"""
+        return sum(
+            matching_result[section]["score"] * weight
+            for section, weight in weights.items()
+            if section in matching_result
+        )
+
+    async def set_weights(self, db, job_id: ObjectId, weights: dict) -> int:
+        """Store a job's weights and re-derive every stored score for it.
+
+        Runs as one update pipeline over the section scores already in MongoDB,
+        so no Gemini calls are made. Returns the number of records updated.
+        """
+        weights = self.normalize_weights(weights)
+        await db.jobs.update_one({"_id": job_id}, {"$set": {"weights": weights}})
+        return await self._rescore(db, job_id, weights)
+
+    async def _rescore(self, db, job_id: ObjectId, weights: dict, candidate_ids: Optional[list] = None) -> int:
+        """Recompute stored scores of a job, or of some of its candidates, from their section scores"""
+        query = {"job_id": job_id, "prefiltered": {"$ne": True}}
+        if candidate_ids is not None:
+            query["candidate_id"] = {"$in": candidate_ids}
+
+        result = await db.matching.update_many(
+            query,
+            [{"$set": {"score": {"$add": [
+                {"$multiply": [{"$ifNull": [f"${section}.score", 0]}, weight]}
+                for section, weight in weights.items()
+            ]}}}]
+        )
+        return result.modified_count
+
+    async def _current_weights(self, db, job_id: ObjectId) -> dict:
+        """Read a job's weights without loading the rest of the document"""
+        job = await db.jobs.find_one({"_id": job_id}, {"weights": 1})
+        return self.job_weights(job or {})
+
+    async def _existing_versions(self, db, job_id, candidate_ids: list) -> dict:
+        """Map already matched candidate ids to the (job, candidate) versions they were scored from"""
+        cursor = db.matching.find(
+            {"job_id": job_id, "candidate_id": {"$in": candidate_ids}},
+            {"candidate_id": 1, "job_version": 1, "candidate_version": 1, "_id": 0}
+        )
+        # Records from before versioning have no versions and count as stale;
+        # unchanged content is served from the LLM cache when it is rescored
+        return {
+            doc["candidate_id"]: (doc.get("job_version"), doc.get("candidate_version"))
+            async for doc in cursor
+        }
+
+    @staticmethod
+    def _version(doc: dict) -> str:
+        """Stored analysis version, computed for documents saved before versioning"""
+        return doc.get("analysis_version") or analysis_version(doc)
+
+    async def _analyze(self, candidate: dict, job_data: dict) -> Optional[dict]:
+        """Run the AI matcher for a single candidate, returning None on failure"""
+
+        # Convert ObjectIds to strings for AI processing
+        candidate_data = {**candidate}
+        candidate_data["_id"] = str(candidate_data["_id"])
+
+        try:
+            return await ai_service.analyze_matching(candidate_data, job_data, fallback=False)
+        except Exception as e:
+            logger.error(f"Error matching candidate {candidate_data['_id']}: {str(e)}")
+            return None
+
+    async def _analyze_in_prompts(self, candidates: list, job_data: dict, candidates_per_prompt: int) -> list:
+        """Score candidates several per Gemini call, returning results in input order, None for failures"""
+        try:
+            results = await ai_service.analyze_matching_batch(candidates, job_data, candidates_per_prompt)
+        except Exception as e:
+            logger.error(f"Error matching batch of {len(candidates)} candidates: {str(e)}")
+            results = {}
+        return [results.get(str(candidate["_id"])) for candidate in candidates]
+
+    @staticmethod
+    def _build_matching_doc(candidate_id, job_id, matching_result: dict) -> dict:
+        """Prepare a matching document from an AI result"""
+        return {
+            "candidate_id": candidate_id,
+            "job_id": job_id,
+            "degree": matching_result["degree"],
+            "experience": matching_result["experience"],
+            "technical_skill": matching_result["technical_skill"],
+            "responsibility": matching_result["responsibility"],
+            "certificate": matching_result["certificate"],
+            "soft_skill": matching_result["soft_skill"],
+            "summary_comment": matching_result["summary_comment"],
+            "score": matching_result["score"],
+            "created_at": datetime.utcnow()
+        }
+
+
+# Global matching service instance
+matching_service = MatchingService()
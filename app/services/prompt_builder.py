@@ -0,0 +1,100 @@
+import hashlib
+import json
+import math
+from typing import Dict, List, Tuple
+
+# Sections the matcher scores; everything else on a job or candidate is noise to the LLM
+MATCHING_SECTIONS = ("degree", "experience", "technical_skill", "responsibility", "certificate", "soft_skill")
+
+# Rough characters-per-token ratio for Gemini on English text
+CHARS_PER_TOKEN = 4
+# Longest single requirement or profile entry that is sent verbatim
+MAX_ITEM_CHARS = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact_prompt(text: str) -> str:
+    """Drop indentation and blank lines from a prompt template"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+def fit_text(text: str, max_tokens: int) -> str:
+    """Truncate free text to a token budget, cutting at a line or word boundary"""
+    text = text.strip()
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    cut = text[:max_chars]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > max_chars // 2:
+        cut = cut[:boundary]
+    return cut.rstrip()
+
+
+def _clip_item(item) -> str:
+    """Normalize one entry and cap its length"""
+    item = " ".join(str(item).split())
+    if len(item) > MAX_ITEM_CHARS:
+        item = item[:MAX_ITEM_CHARS].rsplit(" ", 1)[0] + "…"
+    return item
+
+
+def _profile_sections(doc: dict) -> Dict[str, List[str]]:
+    """Pick the scoring sections of a job or candidate"""
+    return {
+        section: [_clip_item(item) for item in (doc.get(section) or []) if str(item).strip()]
+        for section in MATCHING_SECTIONS
+    }
+
+
+def _fit_sections(profiles: Dict[str, Dict[str, List[str]]], max_chars: int):
+    """Drop trailing entries from the largest sections until the profiles fit"""
+
+    def size(items: List[str]) -> int:
+        return sum(len(item) + 3 for item in items)
+
+    total = sum(size(items) for sections in profiles.values() for items in sections.values())
+    while total > max_chars:
+        # Trim the section that currently costs the most; its last entries matter least
+        owner, section = max(
+            ((owner, section) for owner, sections in profiles.items() for section in sections),
+            key=lambda key: size(profiles[key[0]][key[1]])
+        )
+        items = profiles[owner][section]
+        if not items:
+            break
+        removed = items.pop()
+        total -= len(removed) + 3
+
+
+def serialize(data) -> str:
+    """Serialize to compact, canonical JSON"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def build_matching_content(job: dict, candidate: dict, max_tokens: int) -> Tuple[str, str]:
+    """Serialize the scoring-relevant parts of a job and candidate within a token budget"""
+    profiles = {
+        "job": _profile_sections(job),
+        "candidate": _profile_sections(candidate)
+    }
+
+    header_job = {"job_name": job.get("job_name", "")}
+    header_candidate = {"candidate_name": candidate.get("candidate_name", "")}
+    reserved = len(serialize(header_job)) + len(serialize(header_candidate))
+    _fit_sections(profiles, max(0, max_tokens * CHARS_PER_TOKEN - reserved))
+
+    requirement = serialize({**header_job, **profiles["job"]})
+    candidate_profile = serialize({**header_candidate, **profiles["candidate"]})
+    return requirement, candidate_profile
+
+
+def analysis_version(doc: dict) -> str:
+    """Hash of the sections the matcher scores, so stale matching records can be detected"""
+    sections = {section: doc.get(section) or [] for section in MATCHING_SECTIONS}
+    return hashlib.sha256(serialize(sections).encode("utf-8")).hexdigest()[:16]
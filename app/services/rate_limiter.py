@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the circuit breaker is open"""
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate backs off on throttling and recovers on success.
+
+    The rate is halved on every 429 and grows additively after successful calls,
+    so the client settles just under the quota the server actually grants.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float, max_rate: float):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last refill"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a call may be made"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_throttled(self):
+        """Multiplicative decrease after a 429"""
+        # Calls already in flight when the quota ran out count as one throttle event
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+
+        previous = self.rate
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+        if self.rate != previous:
+            logger.warning(f"Gemini throttled, lowering rate to {self.rate:.2f} req/s")
+
+    def on_success(self):
+        """Additive increase after a successful call"""
+        self.rate = min(self.max_rate, self.rate + self.min_rate / 10)
+
+
+class CircuitBreaker:
+    """Stops calls after repeated transient failures, then probes before resuming."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # Number of times the breaker has opened, so callers can tell an outage happened
+        self.open_count = 0
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe call through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """Whether calls are currently refused"""
+        return self.state == self.OPEN and self.retry_after > 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call is allowed right now"""
+        if self.state == self.OPEN:
+            if self.retry_after > 0:
+                raise CircuitOpenError(f"Gemini circuit open, retry in {self.retry_after:.0f}s")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            # Only one probe at a time while the service is suspect
+            if self._probe_in_flight:
+                raise CircuitOpenError("Gemini circuit half-open, probe in flight")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        if self.state != self.CLOSED:
+            logger.info("Gemini circuit closed")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Free the half-open probe slot when a call ends without an outcome"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        """Count a transient failure, opening the breaker past the threshold"""
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.error(f"Gemini circuit opened after {self._failures} consecutive failures")
+                self.open_count += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    async def wait_until_available(self):
+        """Sleep until the breaker would let a call through"""
+        while True:
+            if self.state == self.OPEN and self.retry_after > 0:
+                await asyncio.sleep(self.retry_after)
+            elif self.state == self.HALF_OPEN and self._probe_in_flight:
+                await asyncio.sleep(0.5)
+            else:
+                return
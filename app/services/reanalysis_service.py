@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.services.ai_service import ai_service
+from app.services.background_runs import BackgroundRuns
+from app.services.document_service import document_service
+from app.services.prompt_builder import analysis_version
+from app.services.rate_limiter import CircuitBreaker
+from app.services.skill_service import skill_service
+from app.services.text_store import text_store
+from app.services.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
+
+# Candidate fields needed to find the CV text
+CANDIDATE_TEXT_PROJECTION = {"filehash": 1, "cv_name": 1}
+
+
+class ReanalysisService(BackgroundRuns):
+    """Re-runs candidate analysis after the candidate prompt or the Gemini model changed.
+
+    Runs live in ``reanalysis_runs``. Candidates already analyzed with the
+    current prompt and model are not selected, which also makes a finished
+    migration safe to run again.
+    """
+
+    collection = "reanalysis_runs"
+    label = "Re-analysis"
+    trace_name = "reanalysis"
+
+    def __init__(self):
+        super().__init__(settings.REANALYSIS_BATCH_SIZE)
+        self.concurrency = settings.REANALYSIS_CONCURRENCY
+
+    @staticmethod
+    def stale_filter(target: dict) -> dict:
+        """Candidates not analyzed with the target prompt and model, including those never stamped"""
+        return {"$or": [{field: {"$ne": value}} for field, value in target.items()]}
+
+    async def start_run(self, db) -> dict:
+        """Create a re-analysis run towards the current prompt and model and execute it in the background"""
+
+        # Only one migration at a time; reuse the one in progress
+        active_run = await self._active_run(db, {})
+        if active_run:
+            return active_run
+
+        target = ai_service.candidate_analysis_info()
+        return await self._create_run(db, {
+            "target": target,
+            "total": await db.candidates.count_documents(self.stale_filter(target))
+        })
+
+    async def _prepare(self, db, run: dict) -> tuple[dict, dict, dict]:
+        """Stale candidates towards the current target; the upload listing is cached per run"""
+
+        # A deploy changed the prompt or model mid-run: retarget and rescan,
+        # candidates already at the new version are filtered out anyway
+        target = ai_service.candidate_analysis_info()
+        if run["target"] != target:
+            run.update({
+                "target": target,
+                "total": await db.candidates.count_documents(self.stale_filter(target)),
+                "processed": 0, "skipped": 0, "failed": 0,
+                "last_candidate_id": None
+            })
+            await self._update_run(db, run["_id"], {
+                field: run[field]
+                for field in ("target", "total", "processed", "skipped", "failed", "last_candidate_id")
+            })
+
+        return self.stale_filter(target), CANDIDATE_TEXT_PROJECTION, {"target": target, "uploads": None}
+
+    async def _process_batch(self, db, run: dict, candidates: list, context: dict) -> dict:
+        """Re-analyze one batch: one text lookup, bounded concurrent analysis, one bulk write"""
+        target = context["target"]
+        texts = await self._load_texts(db, candidates, context)
+
+        # Without text there is nothing to analyze; the candidate stays stale
+        pending = [c for c in candidates if texts.get(c.get("filehash"))]
+        skipped_count = len(candidates) - len(pending)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        updates = []
+        profiles = []
+        failed = []
+        while pending:
+            outages = ai_service.circuit_breaker.open_count
+
+            results = await asyncio.gather(
+                *(self._analyze(texts[candidate["filehash"]], semaphore) for candidate in pending)
+            )
+
+            failed = []
+            now = datetime.utcnow()
+            for candidate, result in zip(pending, results):
+                if result is None:
+                    failed.append(candidate)
+                    continue
+                updates.append(UpdateOne({"_id": candidate["_id"]}, {"$set": {
+                    **result,
+                    "skill_terms": skill_service.candidate_skill_terms(result),
+                    # A new analysis version marks the candidate's matches stale
+                    "analysis_version": analysis_version(result),
+                    **target,
+                    "reanalyzed_at": now
+                }}))
+                profiles.append((candidate["_id"], result))
+
+            # If Gemini went down meanwhile, pause the run instead of recording failures
+            breaker = ai_service.circuit_breaker
+            if not failed or (breaker.state != CircuitBreaker.OPEN and breaker.open_count == outages):
+                break
+            await self._pause_run(db, run["_id"])
+            pending = failed
+
+        if updates:
+            await db.candidates.bulk_write(updates, ordered=False)
+            await vector_index.upsert_many(profiles)
+
+        return {"processed": len(updates), "skipped": skipped_count, "failed": len(failed)}
+
+    async def _analyze(self, cv_content: str, semaphore: asyncio.Semaphore) -> Optional[dict]:
+        """Analyze one CV, returning None on failure so the stored analysis is kept"""
+        async with semaphore:
+            try:
+                return await ai_service.analyze_candidate(cv_content, fallback=False)
+            except Exception as e:
+                logger.error(f"Error re-analyzing candidate: {str(e)}")
+                return None
+
+    async def _load_texts(self, db, candidates: list, context: dict) -> dict[str, str]:
+        """Stored CV texts by file hash, extracting and storing those only on disk"""
+        filehashes = [c["filehash"] for c in candidates if c.get("filehash")]
+        texts = await text_store.get_many(db, filehashes)
+
+        # Candidates uploaded before texts were stored: find their file by name and hash
+        for candidate in candidates:
+            filehash = candidate.get("filehash")
+            if not filehash or filehash in texts:
+                continue
+
+            filename = await self._find_upload(candidate.get("cv_name"), filehash, context)
+            if filename is None:
+                continue
+
+            extracted = await document_service.extract_text(filename)
+            if extracted.text:
+                await text_store.save(db, filehash, extracted.text, extracted.pages)
+                texts[filehash] = extracted.text
+
+        return texts
+
+    async def _find_upload(self, cv_name: Optional[str], filehash: str, context: dict) -> Optional[str]:
+        """Saved upload of a candidate, matched by original name and verified by hash"""
+        if not cv_name:
+            return None
+        if context["uploads"] is None:
+            # One directory listing per run rather than per candidate
+            context["uploads"] = await asyncio.to_thread(document_service.upload_index)
+
+        for filename in context["uploads"].get(cv_name, []):
+            try:
+                if await asyncio.to_thread(document_service.file_hash, filename) == filehash:
+                    return filename
+            except OSError:
+                continue
+        return None
+
+
+# Global re-analysis service instance
+reanalysis_service = ReanalysisService()
@@ -0,0 +1,135 @@
+import re
+import logging
+from typing import Iterable, List
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Canonical names for common spellings and abbreviations
+SKILL_ALIASES = {
+    "k8s": "kubernetes",
+    "kube": "kubernetes",
+    "js": "javascript",
+    "ecmascript": "javascript",
+    "ts": "typescript",
+    "py": "python",
+    "python3": "python",
+    "golang": "go",
+    "node": "node.js",
+    "nodejs": "node.js",
+    "reactjs": "react",
+    "react.js": "react",
+    "vuejs": "vue",
+    "vue.js": "vue",
+    "angularjs": "angular",
+    "postgres": "postgresql",
+    "psql": "postgresql",
+    "mongo": "mongodb",
+    "mssql": "sql server",
+    "ms sql": "sql server",
+    "microsoft sql server": "sql server",
+    "amazon web services": "aws",
+    "gcp": "google cloud",
+    "google cloud platform": "google cloud",
+    "ms azure": "azure",
+    "microsoft azure": "azure",
+    "dotnet": ".net",
+    "c sharp": "c#",
+    "cpp": "c++",
+    "ml": "machine learning",
+    "dl": "deep learning",
+    "nlp": "natural language processing",
+    "ci/cd": "ci-cd",
+    "cicd": "ci-cd",
+    "rest api": "rest",
+    "restful": "rest",
+    "restful api": "rest",
+    "ms office": "microsoft office",
+    "ms excel": "excel",
+    "microsoft excel": "excel",
+}
+
+# Separators between several skills written in one entry
+SKILL_SPLIT_PATTERN = re.compile(r"[,;|/()\[\]]|\band\b|&")
+# Leading/trailing punctuation to drop, keeping symbols that are part of names like c++ or .net
+SKILL_STRIP_CHARS = " \t\n-:*•.'\""
+# Short prefixes that describe a skill rather than name one
+SKILL_NOISE_PREFIXES = ("proficient in ", "experience with ", "knowledge of ", "familiar with ", "basic ")
+
+SKILL_SOURCE_FIELDS = ("technical_skill", "certificate")
+
+
+class SkillService:
+    def normalize_term(self, term: str) -> str:
+        """Normalize a single skill name: case, whitespace and aliases"""
+        term = " ".join(term.lower().split())
+        for prefix in SKILL_NOISE_PREFIXES:
+            if term.startswith(prefix):
+                term = term[len(prefix):]
+
+        # Keep a leading dot for names like .net, and trailing symbols for c++/c#
+        leading_dot = term.startswith(".") and len(term) > 1 and term[1].isalpha()
+        term = term.strip(SKILL_STRIP_CHARS)
+        if leading_dot:
+            term = "." + term
+
+        return SKILL_ALIASES.get(term, term)
+
+    def normalize_skills(self, values: Iterable[str]) -> List[str]:
+        """Split free-text skill entries into unique, normalized terms"""
+        terms = []
+        seen = set()
+        for value in values or []:
+            if not isinstance(value, str):
+                continue
+
+            # Try the whole entry first so aliases like "ci/cd" survive splitting
+            whole = self.normalize_term(value)
+            parts = [whole] if whole in SKILL_ALIASES.values() else SKILL_SPLIT_PATTERN.split(value)
+
+            for part in parts:
+                term = self.normalize_term(part)
+                if term and len(term) <= 64 and term not in seen:
+                    seen.add(term)
+                    terms.append(term)
+        return terms
+
+    def candidate_skill_terms(self, candidate: dict) -> List[str]:
+        """Build the normalized skill array stored on a candidate"""
+        values = []
+        for field in SKILL_SOURCE_FIELDS:
+            values.extend(candidate.get(field) or [])
+        return self.normalize_skills(values)
+
+    def parse_query(self, skills: str) -> List[str]:
+        """Normalize a comma separated skill query"""
+        return self.normalize_skills(skills.split(","))
+
+    async def backfill(self, db, batch_size: int = 500) -> int:
+        """Add skill_terms to candidates stored before normalization existed"""
+        updated = 0
+        projection = {field: 1 for field in SKILL_SOURCE_FIELDS}
+        cursor = db.candidates.find({"skill_terms": {"$exists": False}}, projection)
+
+        operations = []
+        async for candidate in cursor:
+            operations.append(UpdateOne(
+                {"_id": candidate["_id"]},
+                {"$set": {"skill_terms": self.candidate_skill_terms(candidate)}}
+            ))
+            if len(operations) >= batch_size:
+                await db.candidates.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+
+        if operations:
+            await db.candidates.bulk_write(operations, ordered=False)
+            updated += len(operations)
+
+        if updated:
+            logger.info(f"Backfilled skill terms for {updated} candidates")
+        return updated
+
+
+# Global skill service instance
+skill_service = SkillService()
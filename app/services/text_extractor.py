@@ -0,0 +1,91 @@
+"""Plain text extraction from PDF and DOCX files.
+
+Reads pages or paragraphs one at a time and stops once the page or character
+cap is reached, so a long document costs no more than its first pages. The
+pypdf and python-docx imports are deferred to the first file, which is read
+inside an extraction worker rather than the web process.
+"""
+from typing import Iterator, NamedTuple, Optional
+
+
+class ExtractedText(NamedTuple):
+    text: str
+    pages: Optional[int]  # Pages in the whole file, None for DOCX which has no fixed pages
+
+
+def extract_text(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> ExtractedText:
+    """Extract the normalized text of a PDF or DOCX file, up to max_pages and max_chars"""
+    lowered = file_path.lower()
+    if lowered.endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_path)
+        return ExtractedText(_join(_pdf_pages(reader, max_pages), max_chars), len(reader.pages))
+    if lowered.endswith(".docx"):
+        return ExtractedText(_join(_docx_blocks(file_path), max_chars), None)
+
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def _join(blocks: Iterator[str], max_chars: Optional[int]) -> str:
+    """Join stripped, non-empty blocks with newlines in one pass, stopping at max_chars"""
+    parts = []
+    size = 0
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        parts.append(block)
+        size += len(block) + 1
+        if max_chars and size >= max_chars:
+            break
+
+    text = "\n".join(parts)
+    return text[:max_chars] if max_chars else text
+
+
+def _pdf_pages(reader, max_pages: Optional[int]) -> Iterator[str]:
+    """Text of each page; later pages are never parsed once the caller stops"""
+    for index, page in enumerate(reader.pages):
+        if max_pages and index >= max_pages:
+            return
+        yield page.extract_text() or ""
+
+
+def _docx_blocks(file_path: str) -> Iterator[str]:
+    """Header paragraphs, then body paragraphs and table rows in document order.
+
+    DOCX has no fixed pages, so only the character cap applies.
+    """
+    import docx
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(file_path)
+
+    # Contact details often live in the header, shared by every section
+    seen_headers = set()
+    for section in document.sections:
+        header = section.header
+        if header.is_linked_to_previous or id(header._element) in seen_headers:
+            continue
+        seen_headers.add(id(header._element))
+        for paragraph in header.paragraphs:
+            yield paragraph.text
+
+    for child in document.element.body.iterchildren():
+        if child.tag == qn("w:p"):
+            yield Paragraph(child, document).text
+        elif child.tag == qn("w:tbl"):
+            for row in Table(child, document).rows:
+                cells = []
+                previous = None
+                for cell in row.cells:
+                    # Merged cells repeat the same cell object
+                    if cell._tc is previous:
+                        continue
+                    previous = cell._tc
+                    if cell.text:
+                        cells.append(cell.text)
+                yield "\t".join(cells)
@@ -0,0 +1,57 @@
+import logging
+import zlib
+from datetime import datetime
+from typing import Iterable, Optional
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = "zlib"
+COMPRESSION_LEVEL = 6
+
+
+class TextStore:
+    """Extracted CV text kept compressed in the ``candidate_texts`` collection.
+
+    Documents are keyed by the file hash, so re-analysis, indexing and
+    re-matching read the text without the file or the parser. Each one carries
+    its character count, page count and compressed size.
+    """
+
+    @staticmethod
+    def _decompress(doc: dict) -> str:
+        return zlib.decompress(doc["text"]).decode("utf-8")
+
+    async def save(self, db, filehash: str, text: str, pages: Optional[int] = None):
+        """Store a file's text, replacing what was stored for the same hash"""
+        compressed = zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+        await db.candidate_texts.replace_one(
+            {"_id": filehash},
+            {
+                "text": Binary(compressed),
+                "compression": COMPRESSION,
+                "chars": len(text),
+                "pages": pages,
+                "compressed_bytes": len(compressed),
+                "created_at": datetime.utcnow()
+            },
+            upsert=True
+        )
+
+    async def get(self, db, filehash: str) -> Optional[str]:
+        """Return the stored text of a file, None if it was never stored"""
+        doc = await db.candidate_texts.find_one({"_id": filehash}, {"text": 1})
+        return self._decompress(doc) if doc else None
+
+    async def get_many(self, db, filehashes: Iterable[str]) -> dict[str, str]:
+        """Return stored texts by file hash in one query, omitting hashes without text"""
+        cursor = db.candidate_texts.find({"_id": {"$in": list(filehashes)}}, {"text": 1})
+        return {doc["_id"]: self._decompress(doc) async for doc in cursor}
+
+    async def delete(self, db, filehash: str):
+        await db.candidate_texts.delete_one({"_id": filehash})
+
+
+# Global text store instance
+text_store = TextStore()
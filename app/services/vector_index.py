@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core import tracing
+from app.services.prompt_builder import MATCHING_SECTIONS
+from app.services.skill_service import skill_service
+
+try:
+    import fcntl
+except ImportError:  # Windows: fine with a single worker process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to with "
+    "using use used years year experience knowledge good strong ability".split()
+)
+SKILL_WEIGHT = 2.0  # Normalized skill terms count more than loose words
+
+# Fields a profile vector is built from
+VECTOR_PROJECTION = {section: 1 for section in MATCHING_SECTIONS}
+
+ID_DTYPE = "S24"  # ObjectId hex; empty means a free row
+INITIAL_CAPACITY = 1024
+
+
+def profile_features(doc: dict) -> Counter:
+    """Words, word pairs and normalized skills of a candidate profile or job requirement set"""
+    features = Counter()
+    for section in MATCHING_SECTIONS:
+        for value in doc.get(section) or []:
+            if not isinstance(value, str):
+                continue
+            words = [word.rstrip(".") for word in TOKEN_PATTERN.findall(value.lower())]
+            words = [word for word in words if word and word not in STOPWORDS]
+            features.update(words)
+            features.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+
+    features.update(f"skill:{term}" for term in skill_service.candidate_skill_terms(doc))
+    return features
+
+
+def vectorize(doc: dict, dim: int) -> np.ndarray:
+    """Signed feature hashing with sublinear term frequency, L2 normalized"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in profile_features(doc).items():
+        digest = zlib.crc32(feature.encode("utf-8"))
+        weight = 1.0 + math.log(count)
+        if feature.startswith("skill:"):
+            weight *= SKILL_WEIGHT
+        vector[digest % dim] += weight if digest & 0x80000000 else -weight
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class VectorIndex:
+    """Candidate profile vectors in a memory-mapped matrix, one row per candidate.
+
+    ``vectors.f32`` holds the rows and ``ids.bin`` the candidate id of each
+    row, both grown by doubling. Writes reuse free rows and are serialized
+    across worker processes with a lock file; every worker maps the same files,
+    so a search sees rows written by the others. The index is derived data and
+    is rebuilt from MongoDB when empty.
+    """
+
+    def __init__(self, directory: str = None, dim: int = None):
+        self.directory = directory or settings.VECTOR_INDEX_DIR
+        self.dim = dim or settings.VECTOR_DIM
+        self._vectors = None
+        self._ids = None
+        self._meta = None
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self):
+        """Map the files, creating or resetting them if missing or of another dimension"""
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = self._path("meta.bin")
+        if not os.path.exists(meta_path):
+            self._reset(INITIAL_CAPACITY)
+        meta = np.memmap(meta_path, dtype=np.int64, mode="r+", shape=(2,))
+        if int(meta[1]) != self.dim:
+            logger.warning(f"Vector index has dimension {int(meta[1])}, not {self.dim}; resetting it")
+            del meta
+            self._reset(INITIAL_CAPACITY)
+            meta = np.memmap(meta_path, dtype=np.int64, mode="r+", shape=(2,))
+
+        capacity = int(meta[0])
+        vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        ids = np.memmap(self._path("ids.bin"), dtype=ID_DTYPE, mode="r+", shape=(capacity,))
+        self._vectors, self._ids, self._meta = vectors, ids, meta
+
+    def _reset(self, capacity: int):
+        """Create empty files; capacity and dimension go in meta.bin"""
+        for name, size in (("vectors.f32", capacity * self.dim * 4), ("ids.bin", capacity * 24)):
+            with open(self._path(name), "wb") as f:
+                f.truncate(size)
+        meta = np.memmap(self._path("meta.bin"), dtype=np.int64, mode="w+", shape=(2,))
+        meta[:] = (capacity, self.dim)
+        meta.flush()
+
+    def _mapped(self):
+        """Open on first use and remap after another process grew the files"""
+        if self._meta is None or int(self._meta[0]) != self._ids.shape[0]:
+            self._open()
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(".lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._mapped()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _grow(self, capacity: int):
+        """Extend both files to at least the given number of rows"""
+        new_capacity = self._ids.shape[0]
+        while new_capacity < capacity:
+            new_capacity *= 2
+        self._vectors.flush()
+        self._ids.flush()
+        for name, size in (("vectors.f32", new_capacity * self.dim * 4), ("ids.bin", new_capacity * 24)):
+            os.truncate(self._path(name), size)
+        self._meta[0] = new_capacity
+        self._meta.flush()
+        self._open()
+
+    def _write(self, rows: list[tuple[str, np.ndarray]]):
+        """Insert or replace the vectors of candidates"""
+        with self._write_lock():
+            keys = [candidate_id.encode() for candidate_id, _ in rows]
+            existing = np.flatnonzero(np.isin(self._ids, keys))
+            row_of = dict(zip(self._ids[existing].tolist(), existing.tolist()))
+            free = np.flatnonzero(self._ids == b"")
+            next_free = 0
+
+            placements = []
+            for key, (_, vector) in zip(keys, rows):
+                row = row_of.get(key)
+                if row is None:
+                    if next_free == len(free):
+                        start = self._ids.shape[0]
+                        self._grow(start + len(rows))
+                        free = np.arange(start, self._ids.shape[0])
+                        next_free = 0
+                    row = int(free[next_free])
+                    next_free += 1
+                    row_of[key] = row
+                placements.append((row, key, vector))
+
+            # Vector before id, so a concurrent search never pairs an id with an old vector
+            for row, key, vector in placements:
+                self._vectors[row] = vector
+                self._ids[row] = key
+
+    def _remove(self, candidate_id: str):
+        with self._write_lock():
+            rows = np.flatnonzero(self._ids == candidate_id.encode())
+            self._ids[rows] = b""
+            self._vectors[rows] = 0
+
+    def _search(self, vector: np.ndarray, k: int) -> list[tuple[str, float]]:
+        self._mapped()
+        vectors, ids = self._vectors, self._ids
+        scores = vectors @ vector
+        scores[ids == b""] = -np.inf
+
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row].decode(), float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    def size(self) -> int:
+        """Number of candidates in the index"""
+        self._mapped()
+        return int(np.count_nonzero(self._ids != b""))
+
+    async def upsert(self, candidate_id, doc: dict):
+        """Index or re-index one candidate profile"""
+        await self.upsert_many([(candidate_id, doc)])
+
+    async def upsert_many(self, docs: list[tuple]):
+        """Index or re-index (candidate_id, profile) pairs in one locked write"""
+        if not docs:
+            return
+        try:
+            rows = [(str(candidate_id), vectorize(doc, self.dim)) for candidate_id, doc in docs]
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            logger.warning(f"Vector index write failed: {str(e)}")
+
+    async def remove(self, candidate_id):
+        """Drop a candidate from the index"""
+        try:
+            await asyncio.to_thread(self._remove, str(candidate_id))
+        except Exception as e:
+            logger.warning(f"Vector index delete failed: {str(e)}")
+
+    async def search(self, doc: dict, k: int) -> list[tuple[str, float]]:
+        """Candidate ids most similar to a profile or job, with cosine similarity, best first"""
+        with tracing.span("vector_index.search", k=k):
+            return await asyncio.to_thread(self._search, vectorize(doc, self.dim), k)
+
+    async def rebuild(self, db, batch_size: int = 1000) -> int:
+        """Index every candidate from MongoDB, dropping rows of deleted candidates"""
+        await asyncio.to_thread(self._clear, await db.candidates.estimated_document_count())
+
+        indexed = 0
+        batch = []
+        async for candidate in db.candidates.find({}, VECTOR_PROJECTION):
+            batch.append((candidate["_id"], candidate))
+            if len(batch) >= batch_size:
+                await self.upsert_many(batch)
+                indexed += len(batch)
+                batch = []
+        await self.upsert_many(batch)
+        indexed += len(batch)
+
+        logger.info(f"Vector index rebuilt with {indexed} candidates")
+        return indexed
+
+    def _clear(self, expected: int):
+        with self._write_lock():
+            self._ids[:] = b""
+            self._vectors[:] = 0
+            if expected > self._ids.shape[0]:
+                self._grow(expected)
+
+    async def ensure_built(self, db) -> Optional[int]:
+        """Rebuild at startup when the index is empty but candidates exist"""
+        if await asyncio.to_thread(self.size) or not await db.candidates.estimated_document_count():
+            return None
+        return await self.rebuild(db)
+
+
+# Global vector index instance
+vector_index = VectorIndex()
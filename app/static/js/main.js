@@ -79,8 +79,8 @@ function loadDashboard() {
 async function loadDashboardStats() {
     try {
         const [candidates, jobs] = await Promise.all([
-            fetch('/api/candidates/').then(r => r.json()),
-            fetch('/api/jobs/').then(r => r.json())
+            fetch('/api/candidates/?page_size=1').then(r => r.json()),
+            fetch('/api/jobs/?page_size=1').then(r => r.json())
         ]);
         
         document.getElementById('total-candidates').textContent = candidates.total_file || 0;
@@ -113,24 +113,12 @@ function loadCandidates() {
     loadCandidatesTable();
 }
 
-async function loadCandidatesTable() {
+async function loadCandidatesTable(after = null) {
     try {
-        const response = await fetch('/api/candidates/');
+        const url = after ? `/api/candidates/?after=${encodeURIComponent(after)}` : '/api/candidates/';
+        const response = await fetch(url);
         const data = await response.json();
-        
-        const tableHtml = `
-            <table class="table">
-                <thead>
-                    <tr>
-                        <th>Name</th>
-                        <th>Email</th>
-                        <th>CV File</th>
-                        <th>Upload Date</th>
-                        <th>Actions</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    ${data.results.map(candidate => `
+        const rows = data.results.map(candidate => `
                         <tr>
                             <td>${candidate.candidate_name || 'Unknown'}</td>
                             <td>${candidate.email || '-'}</td>
@@ -145,12 +133,38 @@ async function loadCandidatesTable() {
                                 </button>
                             </td>
                         </tr>
-                    `).join('')}
+                    `).join('');
+        const container = document.getElementById('candidates-table');
+        const loadMore = data.next_after
+            ? `<button class="btn btn-sm btn-secondary mt-2" onclick="loadCandidatesTable('${data.next_after}')">Load more</button>`
+            : '';
+        
+        // Later pages are appended to the table already on screen
+        if (after) {
+            container.querySelector('tbody').insertAdjacentHTML('beforeend', rows);
+            container.querySelector('.load-more').innerHTML = loadMore;
+            return;
+        }
+        
+        const tableHtml = `
+            <table class="table">
+                <thead>
+                    <tr>
+                        <th>Name</th>
+                        <th>Email</th>
+                        <th>CV File</th>
+                        <th>Upload Date</th>
+                        <th>Actions</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    ${rows}
                 </tbody>
             </table>
+            <div class="load-more">${loadMore}</div>
         `;
         
-        document.getElementById('candidates-table').innerHTML = tableHtml;
+        container.innerHTML = tableHtml;
     } catch (error) {
         console.error('Error loading candidates:', error);
         document.getElementById('candidates-table').innerHTML = '<p>Error loading candidates</p>';
@@ -220,18 +234,38 @@ async function handleFiles(files) {
     document.getElementById('upload-area').style.display = 'none';
     
     try {
-        const response = await fetch('/api/candidates/upload', {
+        const response = await fetch('/api/candidates/upload?stream=true', {
             method: 'POST',
             body: formData
         });
         
-        const result = await response.json();
+        // Results arrive as one JSON line per file, as each file finishes
+        const results = [];
+        const progressText = document.querySelector('#upload-progress span');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                results.push(JSON.parse(line));
+                progressText.textContent = `Analyzed ${results.length} of ${files.length} files...`;
+            }
+        }
         
         closeModal();
         loadCandidatesTable();
         
         // Show results
-        alert(`Upload completed!\nProcessed: ${result.results.filter(r => r.status === 'success').length}\nSkipped: ${result.results.filter(r => r.status === 'skipped').length}\nErrors: ${result.results.filter(r => r.status === 'error').length}`);
+        alert(`Upload completed!\nProcessed: ${results.filter(r => r.status === 'success').length}\nSkipped: ${results.filter(r => r.status === 'skipped').length}\nErrors: ${results.filter(r => r.status === 'error').length}`);
         
     } catch (error) {
         console.error('Error uploading files:', error);
@@ -262,22 +296,12 @@ function loadJobs() {
     loadJobsTable();
 }
 
-async function loadJobsTable() {
+async function loadJobsTable(after = null) {
     try {
-        const response = await fetch('/api/jobs/');
+        const url = after ? `/api/jobs/?after=${encodeURIComponent(after)}` : '/api/jobs/';
+        const response = await fetch(url);
         const data = await response.json();
-        
-        const tableHtml = `
-            <table class="table">
-                <thead>
-                    <tr>
-                        <th>Job Title</th>
-                        <th>Created Date</th>
-                        <th>Actions</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    ${data.results.map(job => `
+        const rows = data.results.map(job => `
                         <tr>
                             <td>${job.job_name}</td>
                             <td>${new Date(job.created_at).toLocaleDateString()}</td>
@@ -290,12 +314,36 @@ async function loadJobsTable() {
                                 </button>
                             </td>
                         </tr>
-                    `).join('')}
+                    `).join('');
+        const container = document.getElementById('jobs-table');
+        const loadMore = data.next_after
+            ? `<button class="btn btn-sm btn-secondary mt-2" onclick="loadJobsTable('${data.next_after}')">Load more</button>`
+            : '';
+        
+        // Later pages are appended to the table already on screen
+        if (after) {
+            container.querySelector('tbody').insertAdjacentHTML('beforeend', rows);
+            container.querySelector('.load-more').innerHTML = loadMore;
+            return;
+        }
+        
+        const tableHtml = `
+            <table class="table">
+                <thead>
+                    <tr>
+                        <th>Job Title</th>
+                        <th>Created Date</th>
+                        <th>Actions</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    ${rows}
                 </tbody>
             </table>
+            <div class="load-more">${loadMore}</div>
         `;
         
-        document.getElementById('jobs-table').innerHTML = tableHtml;
+        container.innerHTML = tableHtml;
     } catch (error) {
         console.error('Error loading jobs:', error);
         document.getElementById('jobs-table').innerHTML = '<p>Error loading jobs</p>';
@@ -423,7 +471,17 @@ async function processMatching() {
         });
         
         const result = await response.json();
-        alert(`Matching completed!\nProcessed: ${result.processed}\nSkipped: ${result.skipped}`);
+        if (!response.ok) {
+            alert('Error processing matching');
+            return;
+        }
+        
+        const run = await waitForMatchingRun(result.run_id);
+        if (run.status === 'completed') {
+            alert(`Matching completed!\nProcessed: ${run.processed}\nSkipped: ${run.skipped}\nFailed: ${run.failed}\nPrefiltered: ${run.prefiltered}`);
+        } else {
+            alert(`Matching failed: ${run.error || 'unknown error'}`);
+        }
         
         loadMatchingResults(jobName);
     } catch (error) {
@@ -432,6 +490,31 @@ async function processMatching() {
     }
 }
 
+async function waitForMatchingRun(runId) {
+    // Poll the background run and show its progress until it finishes
+    while (true) {
+        const response = await fetch(`/api/matching/runs/${runId}`);
+        const run = await response.json();
+        
+        if (run.status === 'completed' || run.status === 'failed') {
+            return run;
+        }
+        
+        const done = run.processed + run.skipped + run.failed + run.prefiltered;
+        const eta = run.status === 'paused'
+            ? ' - paused, waiting for the AI service'
+            : run.eta_seconds != null ? ` - about ${Math.ceil(run.eta_seconds)}s left` : '';
+        document.getElementById('matching-results').innerHTML = `
+            <div class="loading">
+                <div class="spinner"></div>
+                <span>Matching ${done} / ${run.total} candidates${eta}</span>
+            </div>
+        `;
+        
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
 async function loadMatchingResults(jobName) {
     document.getElementById('matching-results').innerHTML = `
         <div class="loading">
@@ -466,7 +549,7 @@ async function loadMatchingResults(jobName) {
                             </td>
                             <td>
                                 <span class="badge ${result.matching_status ? 'badge-success' : 'badge-warning'}">
-                                    ${result.matching_status ? 'Matched' : 'Pending'}
+                                    ${result.matching_status ? 'Matched' : (result.prefiltered ? 'Prefiltered' : 'Pending')}
                                 </span>
                             </td>
                             <td>
@@ -0,0 +1,416 @@
+"""End-to-end API benchmark with a fake Gemini model and a local or in-memory MongoDB.
+
+Seeds the database with synthetic candidates and jobs, drives the FastAPI app
+in-process through httpx, and prints throughput and p50/p95/p99 latency per
+endpoint as JSON so runs can be compared across commits:
+
+    python -m benchmarks.bench_api --output bench.json
+    python -m benchmarks.bench_api --mongodb-url mongodb://localhost:27017/resume_ranking_bench
+
+Without --mongodb-url the in-memory mongomock-motor stand-in is used. It has no
+real indexes, so a full-scale run takes several minutes and its numbers are only
+comparable with other in-memory runs; prefer a local MongoDB for absolute
+figures. It also lacks pipeline $lookup, so result pages listing not yet matched
+candidates only work against MongoDB. The target database is dropped before and after the run.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SKILLS = [
+    "python", "javascript", "typescript", "go", "java", "c#", "sql", "postgresql", "mongodb",
+    "docker", "kubernetes", "aws", "azure", "google cloud", "react", "node.js", "fastapi",
+    "django", "machine learning", "rest", "ci-cd", "linux", "terraform", "kafka", "redis"
+]
+DEGREES = ["Bachelor of Computer Science", "Master of Software Engineering", "Bachelor of Information Technology"]
+RESPONSIBILITIES = [
+    "Design and build backend services", "Maintain CI/CD pipelines", "Lead code reviews",
+    "Build data pipelines", "Develop web frontends", "Operate cloud infrastructure"
+]
+SOFT_SKILLS = ["English", "Teamwork", "Communication", "Problem solving", "Mentoring"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candidates", type=int, default=10000, help="Candidates to seed")
+    parser.add_argument("--jobs", type=int, default=100, help="Jobs to seed")
+    parser.add_argument("--uploads", type=int, default=20, help="Upload requests to send")
+    parser.add_argument("--upload-batch", type=int, default=5, help="Files per upload request")
+    parser.add_argument("--matching-jobs", type=int, default=1, help="Jobs to run full matching for")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per read endpoint")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent requests per endpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake Gemini latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of fake Gemini calls that fail")
+    parser.add_argument("--mongodb-url", default=None, help="Local MongoDB to use instead of the in-memory stand-in")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace, work_dir: str):
+    """Point the app settings at the fake model and a scratch directory before anything imports them"""
+    os.environ["GEMINI_FAKE"] = "true"
+    os.environ["GEMINI_FAKE_LATENCY"] = str(args.latency)
+    os.environ["GEMINI_FAKE_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["UPLOAD_DIR"] = os.path.join(work_dir, "uploads")
+    # Benchmark candidates must not end up in the real index, which would then never be rebuilt
+    os.environ["VECTOR_INDEX_DIR"] = os.path.join(work_dir, "vector_index")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    # The fake has no quota, so the client side limiter should not be the bottleneck
+    os.environ.setdefault("GEMINI_RATE_LIMIT", "100000")
+    os.environ.setdefault("GEMINI_RATE_BURST", "1000")
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "64")
+    os.environ.setdefault("GEMINI_BACKOFF_BASE", "0.01")
+    # Every run starts from an empty database, so cached replies would only add writes
+    os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    """Throughput and latency percentiles for one scenario, in milliseconds"""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0
+    }
+
+
+async def measure(requests: list, concurrency: int) -> dict:
+    """Run request factories with bounded concurrency and time each one"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def timed(make_request):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await make_request()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(make_request) for make_request in requests))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def fake_candidate(rng: random.Random, index: int, created_at: datetime) -> dict:
+    skills = rng.sample(SKILLS, rng.randint(3, 8))
+    return {
+        "candidate_name": f"Candidate {index}",
+        "phone_number": f"+1555{index:07d}",
+        "email": f"candidate{index}@example.com",
+        "comment": "Seeded by the benchmark",
+        "degree": [rng.choice(DEGREES)],
+        "experience": [f"{rng.randint(0, 15)} years software engineering"],
+        "technical_skill": skills,
+        "responsibility": rng.sample(RESPONSIBILITIES, 2),
+        "certificate": [],
+        "soft_skill": rng.sample(SOFT_SKILLS, 2),
+        "job_recommended": ["Backend Engineer"],
+        "office": rng.randint(0, 5),
+        "sql": rng.randint(0, 5),
+        "cv_name": f"seed_{index}.pdf",
+        "filehash": hashlib.sha256(f"seed-{index}".encode()).hexdigest(),
+        "created_at": created_at
+    }
+
+
+def fake_job(rng: random.Random, index: int, created_at: datetime) -> dict:
+    return {
+        "job_name": f"Benchmark Job {index:03d}",
+        "job_description": " ".join(rng.choice(RESPONSIBILITIES) for _ in range(40)),
+        "degree": [rng.choice(DEGREES)],
+        "experience": [f"{rng.randint(1, 8)}+ years software engineering"],
+        "technical_skill": rng.sample(SKILLS, 5),
+        "responsibility": rng.sample(RESPONSIBILITIES, 3),
+        "certificate": [],
+        "soft_skill": rng.sample(SOFT_SKILLS, 2),
+        "created_at": created_at
+    }
+
+
+def make_pdf(lines: list) -> bytes:
+    """Build a minimal one-page PDF with the given lines of text"""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    stream = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+    ]
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        body += f"{offset:010d} 00000 n \n".encode("latin-1")
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return body
+
+
+def fake_cv(rng: random.Random, index: int) -> bytes:
+    return make_pdf([
+        f"Upload Candidate {index}",
+        f"upload{index}@example.com",
+        rng.choice(DEGREES),
+        f"{rng.randint(0, 15)} years software engineering",
+        "Skills: " + ", ".join(rng.sample(SKILLS, 5)),
+        rng.choice(RESPONSIBILITIES)
+    ])
+
+
+async def seed(db, args: argparse.Namespace, rng: random.Random) -> dict:
+    """Insert synthetic candidates and jobs directly, bypassing the LLM"""
+    from app.services import prompt_builder
+    from app.services.skill_service import skill_service
+
+    started = time.perf_counter()
+    base = datetime.utcnow() - timedelta(days=30)
+
+    batch = []
+    for index in range(args.candidates):
+        candidate = fake_candidate(rng, index, base + timedelta(seconds=index))
+        candidate["skill_terms"] = skill_service.candidate_skill_terms(candidate)
+        candidate["analysis_version"] = prompt_builder.analysis_version(candidate)
+        batch.append(candidate)
+        if len(batch) >= 1000:
+            await db.candidates.insert_many(batch)
+            batch = []
+    if batch:
+        await db.candidates.insert_many(batch)
+
+    jobs = []
+    for index in range(args.jobs):
+        job = fake_job(rng, index, base + timedelta(seconds=index))
+        job["analysis_version"] = prompt_builder.analysis_version(job)
+        jobs.append(job)
+    if jobs:
+        await db.jobs.insert_many(jobs)
+
+    return {"candidates": args.candidates, "jobs": args.jobs, "seconds": round(time.perf_counter() - started, 2)}
+
+
+async def bench_lists(client, args: argparse.Namespace, rng: random.Random) -> dict:
+    """Page-number, keyset and dropdown listings"""
+    page_size = 20
+    pages = max(1, args.candidates // page_size)
+    results = {}
+
+    results["list_candidates_page"] = await measure([
+        (lambda page=rng.randint(1, pages): client.get("/api/candidates/", params={"page": page, "page_size": page_size}))
+        for _ in range(args.requests)
+    ], args.concurrency)
+
+    # Collect keyset tokens by walking forward, then replay them concurrently
+    tokens = []
+    after = None
+    for _ in range(min(args.requests, pages)):
+        params = {"page_size": page_size, **({"after": after} if after else {})}
+        after = (await client.get("/api/candidates/", params=params)).json().get("next_after")
+        if not after:
+            break
+        tokens.append(after)
+    results["list_candidates_after"] = await measure([
+        (lambda token=rng.choice(tokens): client.get("/api/candidates/", params={"page_size": page_size, "after": token}))
+        for _ in range(args.requests)
+    ] if tokens else [], args.concurrency)
+
+    results["list_jobs"] = await measure([
+        (lambda: client.get("/api/jobs/", params={"page_size": page_size}))
+        for _ in range(args.requests)
+    ], args.concurrency)
+    results["jobs_all"] = await measure([
+        (lambda: client.get("/api/jobs/all"))
+        for _ in range(args.requests)
+    ], args.concurrency)
+    return results
+
+
+async def bench_uploads(client, args: argparse.Namespace, rng: random.Random) -> dict:
+    """Multi-file uploads through extraction, the fake analysis and the insert"""
+    requests = []
+    for request_index in range(args.uploads):
+        files = []
+        for file_index in range(args.upload_batch):
+            index = request_index * args.upload_batch + file_index
+            files.append(("files", (f"upload_{index}.pdf", fake_cv(rng, index), "application/pdf")))
+        requests.append(lambda files=files: client.post("/api/candidates/upload", files=files))
+
+    # Uploads are heavy; keep the same fan-out a handful of recruiters would produce
+    result = await measure(requests, min(args.concurrency, 4))
+    result["files"] = args.uploads * args.upload_batch
+    return result
+
+
+async def bench_matching(client, db, args: argparse.Namespace) -> tuple:
+    """Start matching runs and time them to completion"""
+    jobs = await db.jobs.find({}, {"job_name": 1}).sort("job_name", 1).limit(args.matching_jobs).to_list(length=None)
+
+    run_ids = []
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for job in jobs:
+        request_started = time.perf_counter()
+        response = await client.post("/api/matching/process", json={"job_name": job["job_name"]})
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            errors += 1
+        else:
+            run_ids.append(response.json()["run_id"])
+    process = summarize(latencies, errors, time.perf_counter() - started)
+
+    # Poll until every run has finished
+    pairs = 0
+    failed = 0
+    while run_ids:
+        await asyncio.sleep(0.2)
+        for run_id in list(run_ids):
+            run = (await client.get(f"/api/matching/runs/{run_id}")).json()
+            if run["status"] in ("completed", "failed"):
+                run_ids.remove(run_id)
+                pairs += run["processed"]
+                failed += run["failed"]
+    elapsed = time.perf_counter() - started
+
+    run = {
+        "jobs": len(jobs),
+        "pairs_scored": pairs,
+        "pairs_failed": failed,
+        "seconds": round(elapsed, 2),
+        "pairs_per_second": round(pairs / elapsed, 2) if elapsed > 0 else 0.0
+    }
+    return process, run, [job["job_name"] for job in jobs]
+
+
+async def bench_results(client, args: argparse.Namespace, rng: random.Random, job_names: list) -> dict:
+    """Ranked result pages for the jobs that were matched"""
+    if not job_names:
+        return summarize([], 0, 0)
+    pages = max(1, args.candidates // 10)
+    return await measure([
+        (lambda job_name=rng.choice(job_names), page=rng.randint(1, min(pages, 50)): client.get(
+            "/api/matching/results", params={"job_name": job_name, "page": page, "page_size": 10}
+        ))
+        for _ in range(args.requests)
+    ], args.concurrency)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    from app.core import database
+    from app.main import app
+    from app.services.ai_service import ai_service
+    from app.services.document_service import document_service
+
+    if args.mongodb_url:
+        await database.init_db()
+        await database.db.client.drop_database(database.db.database.name)
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor is not installed; install it or pass --mongodb-url")
+        database.db.client = AsyncMongoMockClient()
+        database.db.database = database.db.client["resume_ranking_bench"]
+    db = database.db.database
+
+    rng = random.Random(args.seed)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": "mongodb" if args.mongodb_url else "mongomock",
+            "params": {key: value for key, value in vars(args).items() if key != "output"}
+        },
+        "seed": await seed(db, args, rng),
+        "results": {}
+    }
+    # Built after the bulk load, as a migration would on an existing database
+    await database.create_indexes()
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            report["results"].update(await bench_lists(client, args, rng))
+            report["results"]["upload_candidates"] = await bench_uploads(client, args, rng)
+            process, matching_run, job_names = await bench_matching(client, db, args)
+            report["results"]["process_matching"] = process
+            report["results"]["matching_run"] = matching_run
+            report["results"]["get_matching_results"] = await bench_results(client, args, rng, job_names)
+    finally:
+        document_service.shutdown()
+        if args.mongodb_url:
+            await database.db.client.drop_database(db.name)
+            await database.close_db()
+
+    report["gemini"] = {
+        "calls": ai_service.model.calls,
+        "failed": ai_service.model.failed,
+        "token_usage": ai_service.token_usage
+    }
+    return report
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="resume-bench-") as work_dir:
+        configure_environment(args, work_dir)
+        report = asyncio.run(run(args))
+
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
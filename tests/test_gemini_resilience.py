@@ -0,0 +1,260 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.services import cache_service
+from app.services.ai_service import AIService, GeminiUnavailableError
+from app.services.cache_service import LLMCache
+from app.services.fake_gemini import FakeGeminiModel
+from app.services.rate_limiter import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError
+
+JOB = {"technical_skill": ["python", "docker"], "experience": ["3 years backend development"]}
+
+
+def make_candidates(count: int) -> list:
+    return [{"_id": f"{i:024x}", "technical_skill": ["python", f"skill{i}"]} for i in range(count)]
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    """Short backoff so retry paths run in well under a second per call"""
+    monkeypatch.setattr(settings, "GEMINI_BACKOFF_BASE", 0.05)
+    monkeypatch.setattr(settings, "GEMINI_BACKOFF_MAX", 0.5)
+    monkeypatch.setattr(settings, "GEMINI_RETRY_DEADLINE", 20.0)
+    monkeypatch.setattr(settings, "GEMINI_MAX_RETRIES", 20)
+
+
+def make_service(model: FakeGeminiModel) -> AIService:
+    service = AIService()
+    service._model = model
+    service.cache = LLMCache(enabled=False)
+    return service
+
+
+def test_rate_limiter_halves_on_throttling_and_recovers():
+    limiter = AdaptiveRateLimiter(rate=8.0, burst=1, min_rate=1.0, max_rate=8.0)
+
+    limiter.on_throttled()
+    assert limiter.rate == 4.0
+
+    # Throttles from calls already in flight count once
+    limiter.on_throttled()
+    assert limiter.rate == 4.0
+
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(4.1)
+
+
+def test_rate_limiter_never_goes_below_min_rate(monkeypatch):
+    limiter = AdaptiveRateLimiter(rate=2.0, burst=1, min_rate=1.0, max_rate=8.0)
+    clock = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+
+    for _ in range(5):
+        clock[0] += 2
+        limiter.on_throttled()
+    assert limiter.rate == 1.0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_paces_calls():
+    limiter = AdaptiveRateLimiter(rate=20.0, burst=1, min_rate=1.0, max_rate=20.0)
+
+    started = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire()
+    assert time.monotonic() - started >= 0.15
+
+
+def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_count == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # A single probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_count == 2
+
+
+@pytest.mark.asyncio
+async def test_quota_errors_are_retried_and_lower_the_rate(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_FAILURE_THRESHOLD", 100)
+    model = FakeGeminiModel(latency=0, quota_per_second=3)
+    service = make_service(model)
+    initial_rate = service.rate_limiter.rate
+
+    replies = await asyncio.gather(*(service._generate(f"prompt {i}", "test") for i in range(8)))
+
+    assert all(replies)
+    assert model.throttled > 0
+    assert service.rate_limiter.rate < initial_rate
+
+
+@pytest.mark.asyncio
+async def test_service_errors_are_retried(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_FAILURE_THRESHOLD", 100)
+    model = FakeGeminiModel(latency=0, failure_rate=0.5, seed=1)
+    service = make_service(model)
+
+    replies = await asyncio.gather(*(service._generate(f"prompt {i}", "test") for i in range(10)))
+
+    assert all(replies)
+    assert model.failed > 0
+    assert model.calls == 10 + model.failed
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_when_gemini_keeps_failing(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_RESET_TIMEOUT", 60.0)
+    model = FakeGeminiModel(latency=0, failure_rate=1.0)
+    service = make_service(model)
+
+    with pytest.raises(GeminiUnavailableError):
+        await service._generate("prompt", "test")
+    assert service.circuit_breaker.state == CircuitBreaker.OPEN
+
+    # Refused without reaching the model
+    calls = model.calls
+    with pytest.raises(GeminiUnavailableError):
+        await service._generate("prompt", "test")
+    assert model.calls == calls
+
+
+class RevokedKeyModel(FakeGeminiModel):
+    async def generate_content_async(self, prompt: str, **kwargs):
+        self.calls += 1
+        raise google_exceptions.PermissionDenied("API key revoked (fake)")
+
+
+@pytest.mark.asyncio
+async def test_non_transient_error_does_not_close_half_open_circuit(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "GEMINI_CIRCUIT_RESET_TIMEOUT", 0.05)
+    model = RevokedKeyModel(latency=0)
+    service = make_service(model)
+    service.circuit_breaker.record_failure()
+    time.sleep(0.06)
+
+    with pytest.raises(google_exceptions.PermissionDenied):
+        await service._generate("prompt", "test")
+    assert service.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+
+    # The probe slot is free for the next call
+    with pytest.raises(google_exceptions.PermissionDenied):
+        await service._generate("prompt", "test")
+    assert model.calls == 2
+
+
+class PartialBatchModel(FakeGeminiModel):
+    """Leaves the last candidate out of every batch reply"""
+
+    def _answer(self, prompt: str):
+        answer = super()._answer(prompt)
+        if isinstance(answer, list) and len(answer) > 1:
+            return answer[:-1]
+        return answer
+
+
+class UnusableModel(FakeGeminiModel):
+    def _answer(self, prompt: str):
+        return "Sorry, I cannot help with that"
+
+
+@pytest.mark.asyncio
+async def test_incomplete_batch_reply_is_split():
+    model = PartialBatchModel(latency=0)
+    service = make_service(model)
+    candidates = make_candidates(4)
+
+    results = await service.analyze_matching_batch(candidates, JOB)
+
+    assert set(results) == {candidate["_id"] for candidate in candidates}
+    assert all(service._is_valid_matching(result) for result in results.values())
+    assert model.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_unusable_replies_are_failures_not_scores():
+    service = make_service(UnusableModel(latency=0))
+    candidates = make_candidates(4)
+
+    results = await service.analyze_matching_batch(candidates, JOB)
+    assert results == {candidate["_id"]: None for candidate in candidates}
+
+    with pytest.raises(ValueError):
+        await service.analyze_matching(candidates[0], JOB, fallback=False)
+    assert (await service.analyze_matching(candidates[0], JOB))["score"] == 0
+
+
+class CountingCollection:
+    """Wraps an in-memory collection, counting the round-trips made to it"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def find(self, *args, **kwargs):
+        self.calls.append("find")
+        return self.collection.find(*args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        self.calls.append("bulk_write")
+        return await self.collection.bulk_write(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_batch_reads_and_writes_the_cache_once(monkeypatch):
+    llm_cache = CountingCollection(AsyncMongoMockClient()["test"]["llm_cache"])
+
+    async def get_database():
+        return type("Database", (), {"llm_cache": llm_cache})()
+
+    monkeypatch.setattr(cache_service, "get_database", get_database)
+    model = FakeGeminiModel(latency=0)
+    service = make_service(model)
+    service.cache = LLMCache(enabled=True)
+    candidates = make_candidates(6)
+
+    await service.analyze_matching_batch(candidates, JOB, candidates_per_prompt=2)
+    assert llm_cache.calls == ["find", "bulk_write"]
+    assert model.calls == 3
+
+    # A fresh worker finds every reply in MongoDB with a single query
+    service.cache = LLMCache(enabled=True)
+    results = await service.analyze_matching_batch(candidates, JOB, candidates_per_prompt=2)
+    assert llm_cache.calls == ["find", "bulk_write", "find"]
+    assert model.calls == 3
+    assert service.cache.store_hits == 6
+    assert all(service._is_valid_matching(result) for result in results.values())